@@ -6,7 +6,8 @@
 from __future__ import print_function
 import argparse
 import os
-from collections import defaultdict
+from mgs.compare import run_compare_clusters
+from mgs.sharding import add_shard_arguments
 
 __author__ = "Florian Plaza Oñate"
 __copyright__ = "Copyright 2014, Enterome"
@@ -47,79 +48,76 @@ def get_parameters():
 
 	parser.add_argument('-r', '--ref-file', dest='reference_file', type=is_file, required=True, help='')
 
-	parser.add_argument('-q', '--query-file', dest='query_file', type=is_file, required=True, help='')
+	parser.add_argument('-q', '--query-file', dest='query_files', type=is_file, nargs='+', required=True,
+			help='One or several query clusters files. The reference is indexed once for all of them.')
 
-	parser.add_argument('-o', '--output-file', dest='output_file', required=True, help='')
+	parser.add_argument('-o', '--output-file', dest='output_file',
+			help='Report file when a single query file is given.')
+
+	parser.add_argument('-d', '--output-dir', dest='output_dir', type=is_dir,
+			help='Directory in which the report of each query will be written as <query file name>.txt.')
+
+	parser.add_argument('-s', '--summary-file', dest='summary_file',
+			help='File in which queries ranked by agreement with the reference will be written.')
+
+	parser.add_argument('-t', '--threads', dest='threads', type=int, default=1,
+			help='Number of queries compared in parallel.')
 
 	parser.add_argument('--query-min-cluster-size', dest='query_min_cluster_size', type=int, default=1, help='')
 
-	return parser.parse_args()
-
-def parse_clusters_file(istream):
-	cluster_name, gene_name = None, None
-
-	for line in istream:
-		if cluster_name:
-			yield cluster_name, gene_name
-		cluster_name, gene_name = line.split()
-	
-	if cluster_name:
-		yield cluster_name, gene_name
-
-def index_clusters(clusters_file, min_cluster_size=None):
-	gene_to_clusters = defaultdict(list)
-	cluster_to_genes = defaultdict(list)
-
-	with open(clusters_file, 'r') as istream:
-		for cluster_name, gene_name in parse_clusters_file(istream):
-			gene_to_clusters[gene_name].append(cluster_name)
-			cluster_to_genes[cluster_name].append(gene_name)
-
-	if min_cluster_size:
-		cluster_to_genes = dict((cluster,genes) for cluster,genes in cluster_to_genes.iteritems() if len(genes) >= min_cluster_size)
-
-	return gene_to_clusters, cluster_to_genes
-
-def compare_clusters(gene_to_clusters_ref, cluster_to_genes_query):
-	clusters_query_to_clusters_ref = dict()
-
-	for cluster_query in cluster_to_genes_query.iterkeys():
-		clusters_query_to_clusters_ref[cluster_query] = defaultdict(int)
-		for gene_query in cluster_to_genes_query[cluster_query]:
-			if gene_query in gene_to_clusters_ref :
-				for cluster_ref in gene_to_clusters_ref[gene_query]:
-					clusters_query_to_clusters_ref[cluster_query][cluster_ref] += 1
-			else:
-				clusters_query_to_clusters_ref[cluster_query][None] += 1
-
-	return clusters_query_to_clusters_ref
-
-def write_results(clusters_query_to_clusters_ref, clusters_size_ref, clusters_size_query, output_file):
-	with open(output_file, 'w') as ostream:
-		for cluster_query, cluster_query_to_clusters_ref in sorted(clusters_query_to_clusters_ref.items(),
-				key=lambda (cluster_query,_): clusters_size_query[cluster_query], reverse=True):
-			print("{0} ({1} genes):".format(cluster_query, clusters_size_query[cluster_query]), file=ostream)
-			for cluster_ref in sorted(cluster_query_to_clusters_ref.keys(),
-					key = lambda cluster_ref: cluster_query_to_clusters_ref[cluster_ref], reverse=True):
-				if cluster_ref:
-					print("\t{0} ({1} genes)\t{2}".format(cluster_ref, clusters_size_ref[cluster_ref], cluster_query_to_clusters_ref[cluster_ref]), file=ostream)
-				else:
-					print("\tunknown\t{0}".format(cluster_query_to_clusters_ref[cluster_ref]), file=ostream)
-			print("", file=ostream)
+	parser.add_argument('--approximate', dest='approximate', action='store_true', default=False,
+			help='Estimate overlaps from MinHash sketches of clusters instead of counting them. Requires NumPy. '
+			'Genes of a query cluster which are not attributed to the reference clusters found by LSH are reported as unattributed: '
+			'they either belong to no reference cluster or to reference clusters too dissimilar to be found.')
+
+	parser.add_argument('--max-error', dest='max_error', type=float, default=0.05,
+			help='Maximum error of Jaccard estimates with 95%% confidence, which sets the size of sketches.')
+
+	parser.add_argument('--lsh-threshold', dest='lsh_threshold', type=float, default=0.2,
+			help='Jaccard index above which a reference cluster is likely to be found as a candidate match.')
+
+	parser.add_argument('--sketches-file', dest='sketches_file',
+			help='File in which sketches of the reference are saved, or loaded from if they match the reference and parameters.')
+
+	parser.add_argument('--seed', dest='seed', type=int, default=1,
+			help='Seed of the hash function of sketches.')
+
+	parser.add_argument('--with-similarities', dest='with_similarities', action='store_true', default=False,
+			help='In approximate mode, also report the estimated Jaccard index of each pair of clusters and the containment of the query cluster in the reference cluster.')
+
+	add_shard_arguments(parser)
+
+	parameters = parser.parse_args()
+
+	if len(parameters.query_files) == 1 and not (parameters.output_file or parameters.output_dir):
+		parser.error('one of --output-file or --output-dir is required.')
+	if len(parameters.query_files) > 1:
+		if parameters.output_file:
+			parser.error('--output-file requires a single query file, use --output-dir instead.')
+		if not parameters.output_dir:
+			parser.error('--output-dir is required with several query files.')
+		query_names = [os.path.basename(query_file) for query_file in parameters.query_files]
+		if len(set(query_names)) != len(query_names):
+			parser.error('query files must have distinct names.')
+	if parameters.threads < 1:
+		parser.error('--threads must be at least 1.')
+	if not 0 < parameters.max_error < 0.5:
+		parser.error('--max-error must be between 0 and 0.5.')
+	if not 0 < parameters.lsh_threshold < 1:
+		parser.error('--lsh-threshold must be between 0 and 1.')
+	if parameters.with_similarities and not parameters.approximate:
+		parser.error('--with-similarities requires --approximate.')
+
+	return parameters
+
 def main():
 	parameters = get_parameters()
-	print('STEP 1/4: Indexing reference...')
-	gene_to_clusters_ref, cluster_to_genes_ref = index_clusters(parameters.reference_file)
-	print('STEP 2/4: Indexing query...')
-	gene_to_clusters_query, cluster_to_genes_query = index_clusters(parameters.query_file, parameters.query_min_cluster_size)
-	print('STEP 3/4: Comparing the query to the reference...')
-	clusters_query_to_clusters_ref = compare_clusters(gene_to_clusters_ref, cluster_to_genes_query)
-
-	clusters_size_ref = dict((cluster, len(cluster_genes)) for (cluster, cluster_genes) in cluster_to_genes_ref.iteritems())
-	clusters_size_query = dict((cluster, len(cluster_genes)) for (cluster, cluster_genes) in cluster_to_genes_query.iteritems())
-	print('STEP 4/4: Writing results...')
-	write_results(clusters_query_to_clusters_ref, clusters_size_ref, clusters_size_query, parameters.output_file)
+	output_files = [parameters.output_file or os.path.join(parameters.output_dir, os.path.basename(query_file) + '.txt')
+		for query_file in parameters.query_files]
+	run_compare_clusters(parameters.reference_file, parameters.query_files, output_files, parameters.summary_file,
+		parameters.threads, parameters.query_min_cluster_size, parameters.approximate, parameters.max_error,
+		parameters.lsh_threshold, parameters.sketches_file, parameters.seed, parameters.with_similarities,
+		parameters.output_file or os.path.join(parameters.output_dir, 'compare_clusters'), parameters.shard, parameters.shard_sizes, __file__)
 
 if __name__ == '__main__':
 	main()
-
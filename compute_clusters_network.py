@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Compute the correlation network of clusters from their representative profiles."""
+
+from __future__ import print_function
+import argparse
+import os
+import sys
+from mgs.external_sort import memory_size
+from mgs.network import run_clusters_network
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+def is_file(path):
+    """Check if path is an existing file.
+    """
+
+    if not os.path.isfile(path):
+        if os.path.isdir(path):
+            msg = "{0} is a directory".format(path)
+        else:
+            msg = "{0} does not exist.".format(path)
+        raise argparse.ArgumentTypeError(msg)
+    return path
+
+def get_parameters():
+    """Parse command line parameters.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--clusters-file', dest='clusters_file', type=is_file, required=True, default=argparse.SUPPRESS,
+        help='File which contains line by line, tab separated pairs of values <cluster name> <gene name>.')
+
+    parser.add_argument('--profiles-file', dest='profiles_file', type=is_file, required=True, default=argparse.SUPPRESS,
+        help='File which contains a list of genes and their profile.')
+
+    parser.add_argument('--output-file', dest='output_file', required=True, default=argparse.SUPPRESS,
+        help='File in which the edges <cluster name> <cluster name> <correlation> will be written.')
+
+    parser.add_argument('--with-header', dest='with_header', action='store_true', default=False,
+        help='Indicates whether the profiles file has an header with the names of samples.')
+
+    parser.add_argument('--min-cluster-size', dest='min_cluster_size', type=int, default=1,
+        help='Discard all clusters which have a size below this value.')
+
+    parser.add_argument('--max-cluster-size', dest='max_cluster_size', type=int, default=sys.maxint,
+        help='Discard all clusters which have a size above this value.')
+
+    parser.add_argument('--representative', dest='representative', choices=['mean', 'median'], default='mean',
+        help='How the profiles of the genes of a cluster are summarized into a representative profile. '
+        'The mean is accumulated while reading profiles whereas the median keeps the profiles of all the genes of clusters in memory.')
+
+    parser.add_argument('--method', dest='method', choices=['pearson', 'spearman'], default='pearson',
+        help='Correlation coefficient.')
+
+    parser.add_argument('--threshold', dest='threshold', type=float, default=None,
+        help='Keep only pairs of clusters with a correlation of at least this value.')
+
+    parser.add_argument('--top-k', dest='top_k', type=int, default=None,
+        help='Keep only the k most correlated neighbours of each cluster.')
+
+    parser.add_argument('--memory-limit', dest='memory_limit', type=memory_size, default='1G',
+        help='Approximate memory used by the tiles of the correlation matrix.')
+
+    parameters = parser.parse_args()
+
+    if parameters.threshold is None and parameters.top_k is None:
+        parser.error('at least one of --threshold or --top-k is required.')
+    if parameters.top_k is not None and parameters.top_k < 1:
+        parser.error('--top-k must be at least 1.')
+
+    return parameters
+
+def main():
+    parameters = get_parameters()
+    run_clusters_network(parameters.clusters_file, parameters.profiles_file, parameters.output_file, parameters.with_header,
+            parameters.min_cluster_size, parameters.max_cluster_size, parameters.representative, parameters.method,
+            parameters.threshold, parameters.top_k, parameters.memory_limit)
+
+if __name__ == '__main__':
+    main()
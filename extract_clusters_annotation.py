@@ -6,7 +6,11 @@
 from __future__ import print_function
 import argparse
 import os
-from collections import defaultdict
+import sys
+import tempfile
+from mgs.annotation import run_clusters_annotation, run_clusters_annotation_summary
+from mgs.external_sort import memory_size
+from mgs.sharding import add_shard_arguments
 
 __author__ = "Florian Plaza Oñate"
 __copyright__ = "Copyright 2014-2015, Enterome"
@@ -26,6 +30,17 @@ def is_file(path):
         raise argparse.ArgumentTypeError(msg)
     return path
 
+def is_dir(path):
+    """Check if path is an existing directory.
+    """
+    if not os.path.isdir(path):
+        if os.path.isfile(path):
+            msg = "{0} is a file.".format(path)
+        else:
+            msg = "{0} does not exist.".format(path)
+        raise argparse.ArgumentTypeError(msg)
+    return path
+
 def get_parameters():
     """Parse command line parameters.
     """
@@ -43,57 +58,46 @@ def get_parameters():
     parser.add_argument('--min-cluster-size', dest='min_cluster_size', type=int, default=1,
             help='Discard all clusters which have a size below this value.')
 
-    return parser.parse_args()
-
-def parse_clusters(clusters_file):
-    """ Read the clusters file and creates a dict which map a gene to the list of its clusters.
-    """
-
-    gene_to_clusters = defaultdict(list)
+    parser.add_argument('--memory-limit', dest='memory_limit', type=memory_size, default=None,
+            help='Run out-of-core with about this amount of memory (e.g. 4G). By default, everything is kept in memory.')
 
-    with open(clusters_file, 'r') as clusters_file_istream:
-        for line in clusters_file_istream:
-            cluster_name, gene_name = line.split()
-            gene_name = int(gene_name)
+    parser.add_argument('--tmp-dir', dest='tmp_dir', type=is_dir, default=tempfile.gettempdir(),
+            help='Directory in which temporary files of the out-of-core mode will be written.')
 
-            gene_to_clusters[gene_name].append(cluster_name)
-    
-    return gene_to_clusters
-
-def extract_clusters_annotation(annotation_file, gene_to_clusters):
-    """ Read the annotation file and dispatch each gene annotation to its clusters.
-    """
+    parser.add_argument('--summary', dest='summary', action='store_true', default=False,
+            help='Write one row per cluster with the majority label, its support and the annotation coverage '
+            'of each annotation column instead of the annotation of all the genes.')
 
-    clusters_annotation = defaultdict(list)
-    with open(annotation_file, 'r') as annotation_file_istream:
-        for gene_num, annot in enumerate(annotation_file_istream, start=1):
-            if gene_num in gene_to_clusters:
-                for cluster_name in gene_to_clusters[gene_num]:
-                    clusters_annotation[cluster_name].append(annot)
+    parser.add_argument('--annotation-columns', dest='annotation_columns', default=None,
+            help='Comma separated names of the columns which follow the gene name in the annotation file, '
+            'e.g. kingdom,phylum,genus,function. By default: rank_1,...,rank_n,function.')
 
-    return clusters_annotation
+    parser.add_argument('--functions-separator', dest='functions_separator', default=',',
+            help='Separator of the functional terms of a gene in the last column of the annotation file.')
 
+    add_shard_arguments(parser)
 
-def write_clusters_annotation(output_file, clusters_annotation, min_cluster_size):
+    parameters = parser.parse_args()
 
-    with open(output_file, 'w') as output_file_ostream:
-	for cluster_name in clusters_annotation:
+    if parameters.summary and parameters.memory_limit:
+        parser.error('--summary does not support --memory-limit.')
 
-	    if len(clusters_annotation[cluster_name]) < min_cluster_size :
-		continue
-
-	    for annot in clusters_annotation[cluster_name]:
-		print('{0}\t{1}'.format(cluster_name, annot), file=output_file_ostream, end='')
+    return parameters
 
 def main():
     parameters = get_parameters()
-    print('STEP 1/3: Reading clusters file...')
-    gene_to_clusters = parse_clusters(parameters.clusters_file)
-    print('STEP 2/3: Extracting clusters annotation from annotation file...')
-    clusters_annotation = extract_clusters_annotation(parameters.annotation_file, gene_to_clusters)
-    print('STEP 3/3: Writing clusters annotation...')
-    write_clusters_annotation(parameters.output_file, clusters_annotation, parameters.min_cluster_size)
+    try:
+        if parameters.summary:
+            columns_names = parameters.annotation_columns.split(',') if parameters.annotation_columns else None
+            run_clusters_annotation_summary(parameters.clusters_file, parameters.annotation_file, parameters.output_file,
+                    parameters.min_cluster_size, columns_names, parameters.functions_separator,
+                    parameters.shard, parameters.shard_sizes, __file__)
+        else:
+            run_clusters_annotation(parameters.clusters_file, parameters.annotation_file, parameters.output_file,
+                    parameters.min_cluster_size, parameters.memory_limit, parameters.tmp_dir,
+                    parameters.shard, parameters.shard_sizes, __file__)
+    except ValueError as error:
+        sys.exit(str(error))
 
 if __name__ == '__main__':
     main()
-
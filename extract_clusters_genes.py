@@ -6,6 +6,11 @@
 from __future__ import print_function
 import argparse
 import os
+import sys
+import tempfile
+from mgs.external_sort import memory_size
+from mgs.genes import run_clusters_stats, run_clusters_genes
+from mgs.sharding import add_shard_arguments
 
 __author__ = "Florian Plaza Oñate"
 __copyright__ = "Copyright 2014, Enterome"
@@ -50,82 +55,54 @@ def get_parameters():
 	parser.add_argument('--genes-catalog', dest='genes_catalog', type=is_file, required=True, default=argparse.SUPPRESS,
 			help='Multi-FASTA file which contains all the genes.')
 
-	parser.add_argument('--output-dir', dest='output_dir', type=is_dir, required=True, default='.',
+	parser.add_argument('--output-dir', dest='output_dir', type=is_dir, default='.',
 			help='Directory in which clusters profile will be written.')
 
-	parser.add_argument('--min-cluster-size', dest='min_cluster_size', type=int, default=1,
-			help='Discard all clusters which have a size below this value.')
-
-	return parser.parse_args()
+	parser.add_argument('--stats-file', dest='stats_file', default=None,
+			help='Instead of writing the genes of each cluster, write a table with the number of genes, total length, mean length, '
+			'GC content and fraction of incomplete ORFs of each cluster.')
 
-def parse_clusters(clusters_file):
-	""" Read the clusters file and creates a dict which map a gene to the list of its clusters.
-	"""
-
-	gene_to_clusters = dict()
-
-	with open(clusters_file, 'r') as istream:
-		for line in istream:
-			cluster_name, gene_name = line.split()
-			gene_name = int(gene_name)
-
-			if gene_name in gene_to_clusters:
-				gene_to_clusters[gene_name].append(cluster_name)
-			else:
-				gene_to_clusters[gene_name] = [cluster_name]
-	
-	return gene_to_clusters
-
-def parse_fasta(istream):
-	header, seq = None, []
-	for line in istream:
-		line = line.rstrip()
-		if line.startswith(">"):
-			if header: yield (header, ''.join(seq))
-			header, seq = line, []
-		else:
-			seq.append(line)
-	if header: yield (header, ''.join(seq))
+	parser.add_argument('--threads', dest='threads', type=int, default=1,
+			help='Number of processes which compute clusters statistics on distinct parts of the genes catalog.')
 
+	parser.add_argument('--min-cluster-size', dest='min_cluster_size', type=int, default=1,
+			help='Discard all clusters which have a size below this value.')
 
-def extract_clusters_genes(genes_catalog, gene_to_clusters):
-	""" Read the genes catalog and dispatch each gene profile to its clusters.
-	"""
+	parser.add_argument('--memory-limit', dest='memory_limit', type=memory_size, default=None,
+			help='Run out-of-core with about this amount of memory (e.g. 4G). By default, everything is kept in memory.')
 
-	clusters_genes = dict()
-	with open(genes_catalog, 'r') as istream:
-		for i, fasta_entry in enumerate(parse_fasta(istream),start=1):
-			if i in gene_to_clusters:
-				for cluster_name in gene_to_clusters[i]:
-					if cluster_name in clusters_genes:
-						clusters_genes[cluster_name].append(fasta_entry)
-					else:
-						clusters_genes[cluster_name] = [fasta_entry]
+	parser.add_argument('--tmp-dir', dest='tmp_dir', type=is_dir, default=tempfile.gettempdir(),
+			help='Directory in which temporary files of the out-of-core mode will be written.')
 
-	return clusters_genes
+	parser.add_argument('--checkpoint-interval', dest='checkpoint_interval', type=int, default=None,
+			help='Write clusters genes progressively and save a checkpoint every this number of seconds.')
 
+	parser.add_argument('--resume', dest='resume', action='store_true', default=False,
+			help='Resume from the last checkpoint of a killed run with the same inputs and parameters.')
 
-def write_clusters_genes(output_dir, clusters_genes, min_cluster_size):
-	for cluster_name in clusters_genes:
+	add_shard_arguments(parser)
 
-		if len(clusters_genes[cluster_name]) < min_cluster_size :
-			continue
+	parameters = parser.parse_args()
 
-		output_file = os.path.join(output_dir, cluster_name + '.fna')
+	if parameters.stats_file and parameters.memory_limit:
+		parser.error('--stats-file does not support --memory-limit.')
+	if parameters.stats_file and (parameters.checkpoint_interval is not None or parameters.resume):
+		parser.error('checkpoints are not supported with --stats-file.')
 
-		with open(output_file, 'w') as ostream:
-			for header,seq in clusters_genes[cluster_name]:
-				print("{0}\n{1}".format(header,seq), file=ostream)
+	return parameters
 
 def main():
 	parameters = get_parameters()
-	print('STEP 1/3: Reading clusters file...')
-	gene_to_clusters = parse_clusters(parameters.clusters_file)
-	print('STEP 2/3: Extracting clusters genes from genes catalog...')
-	clusters_genes = extract_clusters_genes(parameters.genes_catalog, gene_to_clusters)
-	print('STEP 3/3: Writing clusters genes...')
-	write_clusters_genes(parameters.output_dir, clusters_genes, parameters.min_cluster_size)
+	try:
+		if parameters.stats_file:
+			run_clusters_stats(parameters.clusters_file, parameters.genes_catalog, parameters.stats_file, parameters.min_cluster_size,
+					parameters.threads, parameters.shard, parameters.shard_sizes, __file__)
+		else:
+			run_clusters_genes(parameters.clusters_file, parameters.genes_catalog, parameters.output_dir, parameters.min_cluster_size,
+					parameters.memory_limit, parameters.tmp_dir, parameters.checkpoint_interval, parameters.resume,
+					parameters.shard, parameters.shard_sizes, __file__)
+	except ValueError as error:
+		sys.exit(str(error))
 
 if __name__ == '__main__':
 	main()
-
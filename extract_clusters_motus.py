@@ -6,7 +6,8 @@
 from __future__ import print_function
 import argparse
 import os
-from collections import defaultdict
+from mgs.motus import run_clusters_motus
+from mgs.sharding import add_shard_arguments
 
 __author__ = "Florian Plaza Oñate"
 __copyright__ = "Copyright 2015, Enterome"
@@ -58,70 +59,14 @@ def get_parameters():
     parser.add_argument('--min-cluster-size', dest='min_cluster_size', type=int, default=1,
             help='Discard clusters which have a size below this value.')
 
-    return parser.parse_args()
-
-def parse_clusters_file(clusters_file, min_cluster_size):
-    """ Read the clusters file and creates a dict which maps a cluster to the list of its genes
-    """
-
-    cluster_to_genes = defaultdict(list)
-
-    with open(clusters_file, 'r') as istream:
-        for line in istream:
-            cluster_name, gene_name = line.split()
-            cluster_to_genes[cluster_name].append(gene_name)
-
-    return dict((cluster,cluster_genes)
-            for cluster,cluster_genes in cluster_to_genes.items() if len(cluster_genes) >= min_cluster_size)
-
-def parse_motus_file(motus_file):
-    """ Read the mOTUs file 
-    """
-
-    all_motus = set()
-    gene_to_motu = dict()
+    add_shard_arguments(parser)
 
-    with open(motus_file, 'r') as istream:
-        for line in istream:
-            line_items = line.split()
-            gene_name, motu_name = line_items[0], line_items[-1]
-            all_motus.add(motu_name)
-            gene_to_motu[gene_name] = motu_name
-    
-    return sorted(all_motus), gene_to_motu
-
-def extract_clusters_motus(cluster_to_genes, all_motus, gene_to_motu):
-    cluster_motus = dict()
-    for cluster, cluster_genes in cluster_to_genes.items():
-
-        cluster_motus[cluster] = dict((motu_name,[]) for motu_name in all_motus)
-
-        for gene_name in cluster_genes:
-            if gene_name in gene_to_motu:
-                cluster_motus[cluster][gene_to_motu[gene_name]].append(gene_name)
-
-    return cluster_motus
-
-def write_clusters_motus(output_dir, cluster_to_genes, cluster_motus, all_motus):
-    for cluster_name, cluster_genes in cluster_to_genes.items():
-
-        output_file = os.path.join(output_dir, cluster_name + '.mOTUs.txt')
-
-        with open(output_file, 'w') as ostream:
-            for motu in all_motus:
-                print("{0}={1}".format(motu,','.join(cluster_motus[cluster_name][motu])), file=ostream)
+    return parser.parse_args()
 
 def main():
     parameters = get_parameters()
-    print('STEP 1/3: Reading clusters file...')
-    cluster_to_genes = parse_clusters_file(parameters.clusters_file, parameters.min_cluster_size)
-    print('STEP 2/4: Reading mOTUs file...')
-    all_motus, gene_to_motu = parse_motus_file(parameters.motus_file)
-    print('STEP 3/4: Extracting clusters mOTUs...')
-    cluster_motus = extract_clusters_motus(cluster_to_genes, all_motus, gene_to_motu)
-    print('STEP 4/4: Writing clusters mOTUs...')
-    write_clusters_motus(parameters.output_dir, cluster_to_genes, cluster_motus, all_motus)
+    run_clusters_motus(parameters.clusters_file, parameters.motus_file, parameters.output_dir, parameters.min_cluster_size,
+            parameters.shard, parameters.shard_sizes, __file__)
 
 if __name__ == '__main__':
     main()
-
@@ -7,7 +7,10 @@ from __future__ import print_function
 import argparse
 import os
 import sys
-from collections import defaultdict
+import tempfile
+from mgs.external_sort import memory_size
+from mgs.profiles import run_clusters_profile
+from mgs.sharding import add_shard_arguments
 
 __author__ = "Florian Plaza Oñate"
 __copyright__ = "Copyright 2014, Enterome"
@@ -16,6 +19,24 @@ __maintainer__ = "Florian Plaza Oñate"
 __email__ = "fplaza-onate@enterome.com"
 __status__ = "Development"
 
+def is_file(path):
+    """Check if path is an existing file.
+    """
+
+    if not os.path.isfile(path):
+        if os.path.isdir(path):
+            msg = "{0} is a directory".format(path)
+        else:
+            msg = "{0} does not exist.".format(path)
+        raise argparse.ArgumentTypeError(msg)
+    return path
+
+def is_file_or_stdin(path):
+    """Check if path is an existing file or - for the standard input.
+    """
+
+    return path if path == '-' else is_file(path)
+
 def is_dir(path):
     """Check if path is an existing file.
     """
@@ -34,10 +55,10 @@ def get_parameters():
     """
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-    parser.add_argument('--clusters-file', dest='clusters_file', type=argparse.FileType('r'), required=True, default=argparse.SUPPRESS,
-        help='File which contains line by line, tab separated pairs of values <cluster name> <gene name>.')
+    parser.add_argument('--clusters-file', dest='clusters_file', type=is_file_or_stdin, required=True, default=argparse.SUPPRESS,
+        help='File which contains line by line, tab separated pairs of values <cluster name> <gene name>, or - for the standard input.')
 
-    parser.add_argument('--profiles-file', dest='profiles_file', type=argparse.FileType('r'), required=True, default=argparse.SUPPRESS,
+    parser.add_argument('--profiles-file', dest='profiles_file', type=is_file, required=True, default=argparse.SUPPRESS,
         help='File which contains a list of genes and their profile.')
 
     parser.add_argument('--output-dir', dest='output_dir', type=is_dir, required=True, default='.',
@@ -52,64 +73,30 @@ def get_parameters():
     parser.add_argument('--max-cluster-size', dest='max_cluster_size', type=int, default=sys.maxint,
         help='Discard all clusters which have a size above this value.')
 
+    parser.add_argument('--memory-limit', dest='memory_limit', type=memory_size, default=None,
+        help='Run out-of-core with about this amount of memory (e.g. 4G). By default, everything is kept in memory.')
 
-    return parser.parse_args()
-
-def parse_clusters(clusters_file):
-    """ Read the clusters file and creates a dict which map a gene to the list of its clusters.
-    """
-
-    gene_to_clusters = defaultdict(list)
-
-    with clusters_file as clusters_file:
-        for line in clusters_file:
-            line_items = line.split()
-            cluster_name, gene_name = line_items[0], line_items[1]
-            gene_to_clusters[gene_name].append(cluster_name)
-
-    return gene_to_clusters
-
-def extract_clusters_profile(profiles_file, with_header, gene_to_clusters):
-    """ Read the profiles table and dispatch each gene profile to its clusters.
-    """
-
-    clusters_profile = defaultdict(list)
+    parser.add_argument('--tmp-dir', dest='tmp_dir', type=is_dir, default=tempfile.gettempdir(),
+        help='Directory in which temporary files of the out-of-core mode will be written.')
 
-    with profiles_file as profiles_file:
-        if with_header:
-            profiles_file.next()
+    parser.add_argument('--checkpoint-interval', dest='checkpoint_interval', type=int, default=None,
+        help='Write clusters profile progressively and save a checkpoint every this number of seconds.')
 
-        for line in profiles_file:
-            gene_name = line.split(None,1)[0]
+    parser.add_argument('--resume', dest='resume', action='store_true', default=False,
+        help='Resume from the last checkpoint of a killed run with the same inputs and parameters.')
 
-            if gene_name in gene_to_clusters:
-                for cluster_name in gene_to_clusters[gene_name]:
-                    clusters_profile[cluster_name].append(line)
+    add_shard_arguments(parser)
 
-    return clusters_profile
-
-def write_clusters_profile(output_dir, clusters_profile, min_cluster_size, max_cluster_size):
-    for cluster_name in clusters_profile:
-
-        cluster_size = len(clusters_profile[cluster_name])
-        if (cluster_size < min_cluster_size) or (cluster_size > max_cluster_size)  :
-            continue
-
-        output_file = os.path.join(output_dir, cluster_name + '_profile.txt')
-
-        with open(output_file, 'w') as ostream:
-            for line in clusters_profile[cluster_name]:
-                ostream.write(line)
+    return parser.parse_args()
 
 def main():
     parameters = get_parameters()
-    print('STEP 1/3: Reading clusters file...')
-    gene_to_clusters = parse_clusters(parameters.clusters_file)
-    print('STEP 2/3: Extracting clusters profile from profiles file...')
-    clusters_profile = extract_clusters_profile(parameters.profiles_file, parameters.with_header, gene_to_clusters)
-    print('STEP 3/3: Writing clusters profile...')
-    write_clusters_profile(parameters.output_dir, clusters_profile, parameters.min_cluster_size, parameters.max_cluster_size)
+    try:
+        run_clusters_profile(parameters.clusters_file, parameters.profiles_file, parameters.output_dir, parameters.with_header,
+                parameters.min_cluster_size, parameters.max_cluster_size, parameters.memory_limit, parameters.tmp_dir,
+                parameters.checkpoint_interval, parameters.resume, parameters.shard, parameters.shard_sizes, __file__)
+    except ValueError as error:
+        sys.exit(str(error))
 
 if __name__ == '__main__':
     main()
-
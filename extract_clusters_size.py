@@ -5,9 +5,10 @@
 
 from __future__ import print_function
 import argparse
+import os
 import sys
-import operator
-from collections import defaultdict
+from mgs.sharding import add_shard_arguments
+from mgs.sizes import run_clusters_size
 
 __author__ = "Florian Plaza Oñate"
 __copyright__ = "Copyright 2014, Enterome"
@@ -16,57 +17,91 @@ __maintainer__ = "Florian Plaza Oñate"
 __email__ = "fplaza-onate@enterome.com"
 __status__ = "Development"
 
+def is_file(path):
+    """Check if path is an existing file.
+    """
+
+    if not os.path.isfile(path):
+        if os.path.isdir(path):
+            msg = "{0} is a directory".format(path)
+        else:
+            msg = "{0} does not exist.".format(path)
+        raise argparse.ArgumentTypeError(msg)
+    return path
+
+def is_dir(path):
+    """Check if path is an existing directory.
+    """
+
+    if not os.path.isdir(path):
+        if os.path.isfile(path):
+            msg = "{0} is a file.".format(path)
+        else:
+            msg = "{0} does not exist.".format(path)
+        raise argparse.ArgumentTypeError(msg)
+
+    return path
 
 def get_parameters():
     """Parse command line parameters.
     """
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-    parser.add_argument('--clusters-file', dest='clusters_file', type=argparse.FileType('r'), required=True, default=argparse.SUPPRESS,
-        help='File which contains line by line, tab separated pairs of values <cluster name> <gene name>.')
+    parser.add_argument('--clusters-file', dest='clusters_files', type=is_file, nargs='+', required=True, default=argparse.SUPPRESS,
+        help='One or several files which contain line by line, tab separated pairs of values <cluster name> <gene name>.')
 
-    parser.add_argument('--output-file', dest='output_file', type=argparse.FileType('w'),default='clusters_size.txt',
-        help='File in which clusters size will be written.')
+    parser.add_argument('--output-file', dest='output_file', default='clusters_size.txt',
+        help='File in which clusters size will be written when a single clusters file is given, or - for the standard output.')
 
-    parser.add_argument('--min-cluster-size', dest='min_cluster_size', type=int, default=1,
-        help='Discard all clusters which have a size below this value.')
+    parser.add_argument('--output-dir', dest='output_dir', type=is_dir, default=None,
+        help='Directory in which clusters size of each clusters file will be written as <clusters file name>.size.txt.')
 
-    parser.add_argument('--max-cluster-size', dest='max_cluster_size', type=int, default=sys.maxint,
-        help='Discard all clusters which have a size above this value.')
-
-    return parser.parse_args()
+    parser.add_argument('--report-file', dest='report_file', default=None,
+        help='File in which the size distribution of the clusters of each clusters file will be written.')
 
-def get_clusters_size(clusters_file):
-    """ Read the clusters file and creates a dict which map each cluster to its size
-    """
+    parser.add_argument('--catalog-size', dest='catalog_size', type=int, default=None,
+        help='Number of genes of the catalog, used to report the fraction of the catalog covered by clusters.')
 
-    clusters_size = defaultdict(int) 
+    parser.add_argument('--threads', dest='threads', type=int, default=1,
+        help='Number of clusters files processed in parallel.')
 
-    with clusters_file as clusters_file:
-        for line in clusters_file:
-            cluster_name = line.split(None, 1)[0]
-            clusters_size[cluster_name] += 1
+    parser.add_argument('--min-cluster-size', dest='min_cluster_size', type=int, default=1,
+        help='Discard all clusters which have a size below this value.')
 
-    return clusters_size
+    parser.add_argument('--max-cluster-size', dest='max_cluster_size', type=int, default=sys.maxint,
+        help='Discard all clusters which have a size above this value.')
 
+    add_shard_arguments(parser)
 
-def write_clusters_size(clusters_size, min_cluster_size, max_cluster_size, output_file):
-    clusters_size = sorted(clusters_size.iteritems(), key=operator.itemgetter(1), reverse=True)
+    parameters = parser.parse_args()
 
-    with output_file as output_file:
-        for cluster_name, cluster_size in clusters_size:
-            if (cluster_size >= min_cluster_size) and (cluster_size <= max_cluster_size):
-                print('{0}\t{1}'.format(cluster_name, cluster_size), file=output_file)
+    if len(parameters.clusters_files) > 1:
+        if not parameters.output_dir:
+            parser.error('--output-dir is required with several clusters files.')
+        clusters_names = [os.path.basename(clusters_file) for clusters_file in parameters.clusters_files]
+        if len(set(clusters_names)) != len(clusters_names):
+            parser.error('clusters files must have distinct names.')
+    if parameters.output_file == '-' and parameters.shard:
+        parser.error('--shard requires an output file, not the standard output.')
+    if parameters.report_file and parameters.shard:
+        parser.error('--report-file is not supported with --shard, run it on the merged clusters size instead.')
+    if parameters.threads < 1:
+        parser.error('--threads must be at least 1.')
 
+    return parameters
 
 def main():
     parameters = get_parameters()
-    print('STEP 1/2: Computing clusters size')
-    clusters_size = get_clusters_size(parameters.clusters_file)
-    print('STEP 2/2: Writing clusters size')
-    write_clusters_size(clusters_size, parameters.min_cluster_size, parameters.max_cluster_size, parameters.output_file)
-    print('Done!')
+    if parameters.output_dir:
+        output_files = [os.path.join(parameters.output_dir, os.path.basename(clusters_file) + '.size.txt')
+            for clusters_file in parameters.clusters_files]
+    else:
+        output_files = [parameters.output_file]
+    run_clusters_size(parameters.clusters_files, output_files, parameters.min_cluster_size, parameters.max_cluster_size,
+        parameters.report_file, parameters.catalog_size, parameters.threads,
+        os.path.join(parameters.output_dir, 'clusters_size') if parameters.output_dir else parameters.output_file,
+        parameters.shard, parameters.shard_sizes, __file__)
+    print('Done!', file=sys.stderr if output_files == ['-'] else sys.stdout)
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Merge the outputs of a sharded run into the outputs of a single run."""
+
+from __future__ import print_function
+import argparse
+import os
+import sys
+from mgs.merge import run_merge_shards
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+def is_file(path):
+    """Check if path is an existing file.
+    """
+
+    if not os.path.isfile(path):
+        if os.path.isdir(path):
+            msg = "{0} is a directory".format(path)
+        else:
+            msg = "{0} does not exist.".format(path)
+        raise argparse.ArgumentTypeError(msg)
+    return path
+
+def get_parameters():
+    """Parse command line parameters.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--manifests', dest='manifest_files', type=is_file, nargs='+', required=True, default=argparse.SUPPRESS,
+        help='Manifests written by each shard of the run.')
+
+    parser.add_argument('--output-manifest', dest='output_manifest', default=None,
+        help='File in which the manifest of the merged outputs will be written.')
+
+    parser.add_argument('--remove-shards', dest='remove_shards', action='store_true', default=False,
+        help='Remove shard-local outputs and manifests once merged.')
+
+    return parser.parse_args()
+
+def main():
+    parameters = get_parameters()
+    try:
+        run_merge_shards(parameters.manifest_files, parameters.output_manifest, parameters.remove_shards)
+    except ValueError as error:
+        sys.exit(str(error))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+"""Library behind the mgs-scripts command line tools.
+
+Submodules are not imported by the package so that importing it stays fast.
+Import the one you need, e.g. from mgs.pipelines import iter_cluster_profiles:
+
+readers: lazy readers of clusters files, genes catalogs, profiles tables and annotation files.
+clusters: indexes of clusters by gene or by cluster name.
+pipelines: lazy generators which dispatch records to clusters and compare clusterings.
+genes, profiles, annotation, motus, sizes: steps of the extract_clusters_* command line tools.
+compare: steps of compare_clusters, exact or estimated from MinHash sketches.
+network: steps of compute_clusters_network (requires NumPy).
+external_sort: external sort and merge join for inputs which do not fit in memory.
+sharding: deterministic assignment of clusters to shards and shard manifests.
+merge: merge of the outputs of a sharded run (merge_shards).
+checkpoint: checkpoints of long extraction runs.
+parallel: process pools whose workers share structures by fork inheritance.
+minhash: MinHash sketches of clusters (requires NumPy).
+"""
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+__all__ = ['readers', 'clusters', 'pipelines', 'genes', 'profiles', 'annotation', 'motus', 'sizes', 'compare', 'network',
+        'external_sort', 'sharding', 'merge', 'checkpoint', 'parallel', 'minhash']
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""Extraction of the annotation of clusters and of its summary from an annotation file."""
+
+from __future__ import print_function
+import operator
+from collections import Counter, defaultdict
+from mgs.clusters import parse_clusters, sort_clusters
+from mgs.pipelines import dispatch_clusters_records, filter_clusters_size, join_clusters_records
+from mgs.readers import read_clusters, read_annotations
+from mgs.sharding import get_shard_filter, shard_path, write_manifest
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014-2015, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+# Values of the annotation file which mean that a gene is not annotated
+MISSING_ANNOTATIONS = ('', 'NA')
+
+def summarize_clusters_annotation(annotation_file, gene_to_clusters, functions_separator, num_columns=None):
+    """ Read the annotation file and count, for each cluster, the genes of each label of each annotation column.
+
+    The annotation file contains line by line the gene name, its taxonomic ranks and its functional terms.
+    Memory depends on the number of distinct labels of each cluster and not on its number of genes.
+    By default, the number of annotation columns is the one of the first clustered gene of the annotation file.
+    Lines with fewer columns have their last columns missing whereas lines with more columns raise a ValueError.
+    """
+
+    clusters_size = defaultdict(int)
+    clusters_counters = dict()
+
+    for gene_num, annot in read_annotations(annotation_file):
+        if gene_num not in gene_to_clusters:
+            continue
+
+        annot_items = annot.rstrip('\n').split('\t')[1:]
+        if num_columns is None:
+            if not annot_items:
+                raise ValueError('Gene {0} has no annotation column, use --annotation-columns to set them.'.format(gene_num))
+            num_columns = len(annot_items)
+        elif len(annot_items) > num_columns:
+            raise ValueError('Gene {0} has {1} annotation columns instead of {2}.'.format(gene_num, len(annot_items), num_columns))
+
+        annot_items += [''] * (num_columns - len(annot_items))
+        genes_labels = [[annot_items[i]] for i in xrange(num_columns-1)]
+        genes_labels.append(annot_items[num_columns-1].split(functions_separator))
+
+        for cluster_name in gene_to_clusters[gene_num]:
+            clusters_size[cluster_name] += 1
+            if cluster_name not in clusters_counters:
+                clusters_counters[cluster_name] = [Counter() for _ in xrange(num_columns)]
+
+            for counter, labels in zip(clusters_counters[cluster_name], genes_labels):
+                # A label repeated in the functional terms of a gene supports it once
+                labels = set(label for label in labels if label not in MISSING_ANNOTATIONS)
+                if labels:
+                    counter.update(labels)
+                    counter[None] += 1
+
+    return clusters_size, clusters_counters, num_columns or 0
+
+def write_clusters_annotation_summary(output_file, clusters_size, clusters_counters, columns_names, min_cluster_size):
+    """ Write for each cluster and each annotation column the majority label, the fraction of
+    annotated genes which support it and the fraction of genes which are annotated.
+    """
+
+    with open(output_file, 'w') as output_file_ostream:
+        header = ['cluster', 'genes']
+        for column_name in columns_names:
+            header.extend([column_name, column_name + '_support', column_name + '_coverage'])
+        print('\t'.join(header), file=output_file_ostream)
+
+        for cluster_name in sorted(clusters_size):
+            cluster_size = clusters_size[cluster_name]
+            if cluster_size < min_cluster_size:
+                continue
+
+            row = [cluster_name, str(cluster_size)]
+            for counter in clusters_counters[cluster_name]:
+                num_annotated = counter.pop(None, 0)
+                if num_annotated:
+                    label, count = min(counter.iteritems(), key=lambda (label, count): (-count, label))
+                    row.extend([label, '{0:.4f}'.format(float(count) / num_annotated), '{0:.4f}'.format(float(num_annotated) / cluster_size)])
+                else:
+                    row.extend(['NA', 'NA', '0.0000'])
+            print('\t'.join(row), file=output_file_ostream)
+
+def write_clusters_annotation(output_file, clusters_annotation):
+
+    with open(output_file, 'w') as output_file_ostream:
+        for cluster_name, cluster_annotation in clusters_annotation:
+            for annot in cluster_annotation:
+                print('{0}\t{1}'.format(cluster_name, annot), file=output_file_ostream, end='')
+
+def run_clusters_annotation(clusters_file, annotation_file, output_file, min_cluster_size=1, memory_limit=None, tmp_dir=None,
+        shard=None, shard_sizes=None, script=None):
+    """ Write the annotation of the genes of each cluster of clusters_file to output_file, sorted by cluster name.
+
+    Runs out-of-core with memory_limit. With shard, output_file is replaced by a shard-local file.
+    """
+
+    in_shard = get_shard_filter(shard, shard_sizes)
+    print('STEP 1/3: Reading clusters file...')
+    if memory_limit:
+        sorted_clusters = sort_clusters(read_clusters(clusters_file, int, in_shard), memory_limit, tmp_dir)
+    else:
+        gene_to_clusters = parse_clusters(read_clusters(clusters_file, int, in_shard))
+
+    print('STEP 2/3: Extracting clusters annotation from annotation file...')
+    if memory_limit:
+        # Annotations of a cluster are ranked by gene number, as in the annotation file
+        annotations = ((gene_num, (gene_num, annot)) for gene_num, annot in read_annotations(annotation_file))
+        clusters_annotation = join_clusters_records(sorted_clusters, annotations, memory_limit, tmp_dir, min_cluster_size)
+    else:
+        # Clusters are written sorted by name, as out-of-core, so that sharded runs can be merged by cluster name
+        clusters_annotation = sorted(filter_clusters_size(dispatch_clusters_records(gene_to_clusters, read_annotations(annotation_file)),
+                min_cluster_size), key=operator.itemgetter(0))
+    print('STEP 3/3: Writing clusters annotation...')
+    shard_output_file = shard_path(output_file, shard)
+    write_clusters_annotation(shard_output_file, clusters_annotation)
+    if shard:
+        write_manifest(shard_output_file + '.manifest.json', script, shard,
+            [{'kind': 'clusters_annotation', 'path': shard_output_file, 'target': output_file}])
+
+def run_clusters_annotation_summary(clusters_file, annotation_file, output_file, min_cluster_size=1, columns_names=None,
+        functions_separator=',', shard=None, shard_sizes=None, script=None):
+    """ Write one row per cluster of clusters_file with the summary of the annotation of its genes to output_file.
+
+    By default, columns are named rank_1,...,rank_n,function, or are left out if no gene is annotated.
+    A ValueError is raised if a gene has more annotation columns than expected. With shard, only the clusters
+    of the shard are summarized.
+    """
+
+    in_shard = get_shard_filter(shard, shard_sizes)
+    print('STEP 1/3: Reading clusters file...')
+    gene_to_clusters = parse_clusters(read_clusters(clusters_file, int, in_shard))
+
+    print('STEP 2/3: Summarizing clusters annotation from annotation file...')
+    clusters_size, clusters_counters, num_columns = summarize_clusters_annotation(annotation_file,
+            gene_to_clusters, functions_separator, len(columns_names) if columns_names else None)
+    if not columns_names:
+        # Without any annotated gene, the annotation columns are unknown
+        columns_names = ['rank_{0}'.format(i) for i in xrange(1, num_columns)] + ['function'] if num_columns else []
+    print('STEP 3/3: Writing clusters annotation summary...')
+    shard_output_file = shard_path(output_file, shard)
+    write_clusters_annotation_summary(shard_output_file, clusters_size, clusters_counters, columns_names, min_cluster_size)
+    if shard:
+        write_manifest(shard_output_file + '.manifest.json', script, shard,
+            [{'kind': 'clusters_annotation_summary', 'path': shard_output_file, 'target': output_file}])
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""Checkpoints of long extraction runs and atomic writing of clusters files."""
+
+from __future__ import print_function
+import json
+import os
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+# Default number of seconds between two checkpoints
+DEFAULT_CHECKPOINT_INTERVAL = 300
+
+def get_checkpoint_interval(checkpoint_interval, resume, memory_limit=None):
+    """ Return the number of seconds between two checkpoints of a run, or None without checkpoints.
+
+    Resuming a run without an interval uses the default one. A ValueError is raised if the
+    interval is below 1 or if checkpoints are requested for an out-of-core run.
+    """
+
+    if resume and checkpoint_interval is None:
+        checkpoint_interval = DEFAULT_CHECKPOINT_INTERVAL
+
+    if checkpoint_interval is not None:
+        if checkpoint_interval < 1:
+            raise ValueError('The checkpoint interval must be at least 1 second.')
+        if memory_limit:
+            raise ValueError('Checkpoints are not supported with a memory limit.')
+
+    return checkpoint_interval
+
+def fingerprint(input_files, **parameters):
+    """ Identify the inputs and parameters of a run so that a checkpoint is not resumed with other ones.
+    """
+
+    files = []
+    for input_file in input_files:
+        stat = os.stat(input_file)
+        files.append([os.path.abspath(input_file), stat.st_size, int(stat.st_mtime)])
+
+    return {'files': files, 'parameters': parameters}
+
+def new_state(run_fingerprint):
+    """ Create the state of a run which starts at the beginning of its input.
+    """
+
+    return {'fingerprint': run_fingerprint, 'offset': 0, 'num_records': 0, 'clusters': {}, 'finalizing': False}
+
+def load_checkpoint(checkpoint_file, run_fingerprint):
+    """ Read the state saved by the last checkpoint, or None if there is no checkpoint.
+    """
+
+    if not os.path.isfile(checkpoint_file):
+        return None
+
+    with open(checkpoint_file, 'r') as istream:
+        state = json.load(istream)
+
+    # JSON turns tuples into lists, compare fingerprints after the same round trip
+    if state['fingerprint'] != json.loads(json.dumps(run_fingerprint)):
+        raise ValueError('{0} was written for other input files or parameters.'.format(checkpoint_file))
+
+    return state
+
+def save_checkpoint(checkpoint_file, state):
+    """ Write the state of a run. The previous checkpoint is replaced atomically.
+    """
+
+    tmp_file = checkpoint_file + '.tmp'
+    with open(tmp_file, 'w') as ostream:
+        json.dump(state, ostream)
+        ostream.flush()
+        os.fsync(ostream.fileno())
+    os.rename(tmp_file, checkpoint_file)
+
+def remove_checkpoint(checkpoint_file):
+    if os.path.isfile(checkpoint_file):
+        os.remove(checkpoint_file)
+
+def restore_clusters_files(clusters_state, cluster_file):
+    """ Truncate the temporary file of each cluster to its size at the last checkpoint.
+
+    Data appended after the last checkpoint is dropped since it will be extracted again.
+    """
+
+    for cluster_name, (file_size, _) in clusters_state.iteritems():
+        with open(cluster_file(cluster_name) + '.tmp', 'r+') as ostream:
+            ostream.truncate(file_size)
+
+def flush_clusters_buffers(clusters_buffers, clusters_state, cluster_file):
+    """ Append the records buffered for each cluster to its temporary file and clear the buffers.
+
+    The temporary file of a cluster unknown to the state is truncated first, so that files
+    left by a run killed before its first checkpoint are overwritten.
+    """
+
+    for cluster_name, records in clusters_buffers.iteritems():
+        if cluster_name in clusters_state:
+            mode = 'a'
+        else:
+            mode = 'w'
+            clusters_state[cluster_name] = [0, 0]
+
+        with open(cluster_file(cluster_name) + '.tmp', mode) as ostream:
+            for record in records:
+                ostream.write(record)
+            ostream.flush()
+            os.fsync(ostream.fileno())
+            clusters_state[cluster_name][0] = ostream.tell()
+        clusters_state[cluster_name][1] += len(records)
+
+    clusters_buffers.clear()
+
+def finalize_clusters_files(state, checkpoint_file, cluster_file, min_cluster_size, max_cluster_size):
+    """ Rename the temporary file of each cluster with a size in bounds to its final name and remove the others.
+
+    The checkpoint records that the run is finalizing before the first file is renamed, so that a resumed
+    run only completes the renames. Clusters whose temporary file is already gone are skipped.
+    """
+
+    if not state.get('finalizing'):
+        state['finalizing'] = True
+        save_checkpoint(checkpoint_file, state)
+
+    written_files = []
+
+    for cluster_name, (_, cluster_size) in state['clusters'].iteritems():
+        output_file = cluster_file(cluster_name)
+        if min_cluster_size <= cluster_size <= max_cluster_size:
+            if os.path.isfile(output_file + '.tmp'):
+                os.rename(output_file + '.tmp', output_file)
+            written_files.append(os.path.basename(output_file))
+        elif os.path.isfile(output_file + '.tmp'):
+            os.remove(output_file + '.tmp')
+
+    return written_files
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""Indexes of clusters built from (cluster name, gene) pairs, such as the ones yielded by mgs.readers.read_clusters."""
+
+from __future__ import print_function
+from collections import defaultdict
+from mgs.external_sort import external_sort
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+def parse_clusters(clusters):
+    """ Create a dict which map a gene to the list of its clusters.
+    """
+
+    gene_to_clusters = defaultdict(list)
+
+    for cluster_name, gene in clusters:
+        gene_to_clusters[gene].append(cluster_name)
+
+    return gene_to_clusters
+
+def group_clusters(clusters, min_cluster_size=1):
+    """ Create a dict which map a cluster with at least min_cluster_size genes to the list of its genes.
+    """
+
+    cluster_to_genes = defaultdict(list)
+
+    for cluster_name, gene in clusters:
+        cluster_to_genes[cluster_name].append(gene)
+
+    return dict((cluster_name, cluster_genes) for cluster_name, cluster_genes in cluster_to_genes.iteritems()
+            if len(cluster_genes) >= min_cluster_size)
+
+def count_clusters_size(gene_to_clusters):
+    """ Count the genes of each cluster of a map of genes to clusters.
+    """
+
+    clusters_size = defaultdict(int)
+
+    for gene_clusters in gene_to_clusters.itervalues():
+        for cluster_name in gene_clusters:
+            clusters_size[cluster_name] += 1
+
+    return clusters_size
+
+def sort_clusters(clusters, memory_limit, tmp_dir=None):
+    """ Sort the (gene, cluster name) pairs of clusters out-of-core.
+
+    Sorted pairs are always read back from disk since they are joined with records which are sorted again.
+    """
+
+    return external_sort(((gene, cluster_name) for cluster_name, gene in clusters), memory_limit, tmp_dir, spill=True)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+"""Comparison of query clusterings to a reference clustering, exact or estimated from MinHash sketches."""
+
+from __future__ import print_function
+import itertools
+from collections import defaultdict
+from mgs.checkpoint import fingerprint
+from mgs.clusters import parse_clusters, group_clusters, count_clusters_size
+from mgs.parallel import fork_map
+from mgs.readers import read_clusters
+from mgs.sharding import get_shard_filter, shard_path, write_manifest
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+def compare_cluster(gene_to_clusters_ref, genes_query):
+    """ Count the genes of a query cluster shared with each reference cluster.
+
+    Genes which belong to no reference cluster are counted under None.
+    """
+
+    cluster_query_to_clusters_ref = defaultdict(int)
+
+    for gene_query in genes_query:
+        if gene_query in gene_to_clusters_ref :
+            for cluster_ref in gene_to_clusters_ref[gene_query]:
+                cluster_query_to_clusters_ref[cluster_ref] += 1
+        else:
+            cluster_query_to_clusters_ref[None] += 1
+
+    return cluster_query_to_clusters_ref
+
+def compare_clusters(gene_to_clusters_ref, cluster_to_genes_query):
+    clusters_query_to_clusters_ref = dict()
+
+    for cluster_query, genes_query in cluster_to_genes_query.iteritems():
+        clusters_query_to_clusters_ref[cluster_query] = compare_cluster(gene_to_clusters_ref, genes_query)
+
+    return clusters_query_to_clusters_ref
+
+def sketch_reference(reference_file, sketches_file, max_error, lsh_threshold, seed):
+    """ Compute MinHash sketches of the reference clusters, or load them from sketches_file, and index them by LSH bands.
+    """
+
+    from mgs import minhash
+
+    num_bins = minhash.num_bins_for_error(max_error)
+    sketches_fingerprint = fingerprint([reference_file], sketch='one_permutation', num_bins=num_bins, seed=seed)
+
+    sketches = minhash.load_sketches(sketches_file, sketches_fingerprint) if sketches_file else None
+    if sketches is None:
+        sketches = minhash.sketch_clusters_file(reference_file, num_bins, seed)
+        if sketches_file:
+            minhash.save_sketches(sketches_file, *(sketches + (sketches_fingerprint,)))
+
+    clusters_name, clusters_size, signatures = sketches
+    bands, rows = minhash.choose_bands(num_bins, lsh_threshold)
+
+    return {'clusters_name': clusters_name, 'clusters_size': clusters_size, 'signatures': signatures,
+        'lsh_index': minhash.build_lsh_index(signatures, bands, rows), 'bands': bands, 'rows': rows,
+        'num_bins': num_bins, 'seed': seed}
+
+def compare_clusters_approximate(ref_sketches, query_sketches):
+    """ Estimate the number of genes shared by each query cluster and the reference clusters found by LSH.
+
+    Genes of a query cluster which are not attributed to a reference cluster are counted under None. Also returns,
+    for each query cluster, the estimated Jaccard index and containment of the query cluster in each reference cluster.
+    """
+
+    from mgs import minhash
+
+    clusters_name_ref, clusters_size_ref = ref_sketches['clusters_name'], ref_sketches['clusters_size']
+    clusters_name_query, clusters_size_query, signatures_query = query_sketches
+
+    # Candidate pairs of all the query clusters are found and estimated at once
+    queries, refs = minhash.find_candidates(ref_sketches['lsh_index'], signatures_query, ref_sketches['bands'], ref_sketches['rows'])
+    jaccards = minhash.estimate_jaccard(signatures_query, ref_sketches['signatures'], queries, refs)
+    overlaps = minhash.estimate_overlap(jaccards, clusters_size_query[queries], clusters_size_ref[refs])
+
+    clusters_query_to_clusters_ref = dict((cluster_query, defaultdict(int)) for cluster_query in clusters_name_query)
+    clusters_query_similarities = dict((cluster_query, dict()) for cluster_query in clusters_name_query)
+
+    for i, j, jaccard, overlap in itertools.izip(queries.tolist(), refs.tolist(), jaccards.tolist(), overlaps.tolist()):
+        cluster_query, size_query = clusters_name_query[i], int(clusters_size_query[i])
+        overlap = min(overlap, size_query)
+        if overlap:
+            clusters_query_to_clusters_ref[cluster_query][clusters_name_ref[j]] = overlap
+            clusters_query_similarities[cluster_query][clusters_name_ref[j]] = (jaccard, float(overlap) / size_query)
+
+    for cluster_query, size_query in itertools.izip(clusters_name_query, clusters_size_query.tolist()):
+        cluster_query_to_clusters_ref = clusters_query_to_clusters_ref[cluster_query]
+        num_unattributed_genes = size_query - sum(cluster_query_to_clusters_ref.itervalues())
+        if num_unattributed_genes > 0:
+            cluster_query_to_clusters_ref[None] = num_unattributed_genes
+
+    return clusters_query_to_clusters_ref, clusters_query_similarities
+
+def write_results(clusters_query_to_clusters_ref, clusters_size_ref, clusters_size_query, output_file, estimated=False, similarities=None):
+    # Estimated numbers of shared genes are prefixed by ~ and genes not attributed to a reference cluster may belong to one
+    count_format = "~{0}" if estimated else "{0}"
+    unknown_label = "unattributed" if estimated else "unknown"
+
+    with open(output_file, 'w') as ostream:
+        for cluster_query, cluster_query_to_clusters_ref in sorted(clusters_query_to_clusters_ref.items(),
+                key=lambda (cluster_query,_): (-clusters_size_query[cluster_query], cluster_query)):
+            print("{0} ({1} genes):".format(cluster_query, clusters_size_query[cluster_query]), file=ostream)
+            for cluster_ref in sorted(cluster_query_to_clusters_ref.keys(),
+                    key = lambda cluster_ref: (-cluster_query_to_clusters_ref[cluster_ref], cluster_ref is None, cluster_ref)):
+                if cluster_ref:
+                    row = "\t{0} ({1} genes)\t{2}".format(cluster_ref, clusters_size_ref[cluster_ref],
+                        count_format.format(cluster_query_to_clusters_ref[cluster_ref]))
+                    if similarities:
+                        row += "\tjaccard=~{0:.4f}\tcontainment=~{1:.4f}".format(*similarities[cluster_query][cluster_ref])
+                    print(row, file=ostream)
+                else:
+                    print("\t{0}\t{1}".format(unknown_label, count_format.format(cluster_query_to_clusters_ref[cluster_ref])), file=ostream)
+            print("", file=ostream)
+
+def compute_agreement(clusters_query_to_clusters_ref, clusters_size_query):
+    """ Summarize how well a query agrees with the reference.
+
+    Each query cluster is matched to the reference cluster with which it shares the most genes.
+    The agreement is the fraction of the query genes found in the matched reference clusters.
+    """
+
+    num_genes = sum(clusters_size_query.itervalues())
+    num_unknown_genes = 0
+    num_matched_genes = 0
+
+    for cluster_query_to_clusters_ref in clusters_query_to_clusters_ref.itervalues():
+        num_unknown_genes += cluster_query_to_clusters_ref.get(None, 0)
+        num_matched_genes += max([count for cluster_ref, count in cluster_query_to_clusters_ref.iteritems() if cluster_ref] or [0])
+
+    agreement = float(num_matched_genes) / num_genes if num_genes else 0.0
+
+    return len(clusters_size_query), num_genes, num_unknown_genes, num_matched_genes, agreement
+
+# Reference index (or sketches) and shard filter of query clusters, set by fork_map
+gene_to_clusters_ref, ref_sketches, clusters_size_ref, in_shard = None, None, None, None
+
+def compare_query(task):
+    """ Compare a query file to the shared reference index and write its report.
+    """
+
+    query_file, output_file, query_min_cluster_size, with_similarities = task
+
+    if ref_sketches:
+        from mgs import minhash
+
+        query_sketches = minhash.sketch_clusters_file(query_file, ref_sketches['num_bins'], ref_sketches['seed'],
+            query_min_cluster_size, in_shard)
+        clusters_query_to_clusters_ref, similarities = compare_clusters_approximate(ref_sketches, query_sketches)
+        clusters_size_query = dict(zip(query_sketches[0], (int(size) for size in query_sketches[1])))
+        write_results(clusters_query_to_clusters_ref, clusters_size_ref, clusters_size_query, output_file,
+            estimated=True, similarities=similarities if with_similarities else None)
+    else:
+        cluster_to_genes_query = group_clusters(read_clusters(query_file, in_shard=in_shard), query_min_cluster_size)
+        clusters_query_to_clusters_ref = compare_clusters(gene_to_clusters_ref, cluster_to_genes_query)
+        clusters_size_query = dict((cluster, len(cluster_genes)) for (cluster, cluster_genes) in cluster_to_genes_query.iteritems())
+        write_results(clusters_query_to_clusters_ref, clusters_size_ref, clusters_size_query, output_file)
+
+    return (query_file,) + compute_agreement(clusters_query_to_clusters_ref, clusters_size_query)
+
+def rank_queries(queries_summary):
+    """ Sort queries by decreasing agreement with the reference.
+    """
+
+    return sorted(queries_summary, key=lambda query_summary: (-query_summary[-1], query_summary[0]))
+
+def write_summary(queries_summary, summary_file, estimated=False):
+    # Genes not attributed to a reference cluster by estimates may belong to one, as in write_results
+    unknown_column = "unattributed_genes" if estimated else "unknown_genes"
+
+    with open(summary_file, 'w') as ostream:
+        print("rank\tquery_file\tclusters\tgenes\t{0}\tmatched_genes\tagreement".format(unknown_column), file=ostream)
+        for rank, (query_file, num_clusters, num_genes, num_unknown_genes, num_matched_genes, agreement) in enumerate(queries_summary, start=1):
+            print("{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6:.4f}".format(rank, query_file, num_clusters, num_genes,
+                num_unknown_genes, num_matched_genes, agreement), file=ostream)
+
+def run_compare_clusters(reference_file, query_files, output_files, summary_file=None, threads=1, query_min_cluster_size=1,
+        approximate=False, max_error=0.05, lsh_threshold=0.2, sketches_file=None, seed=1, with_similarities=False,
+        manifest_prefix=None, shard=None, shard_sizes=None, script=None):
+    """ Compare each query file to the reference file, write its report to the matching output file and
+    return the queries ranked by agreement with the reference.
+
+    The reference is indexed, or sketched with approximate, once for all the queries which are compared
+    by up to threads processes. With shard, only the query clusters of the shard are compared and the
+    path of the manifest starts with manifest_prefix.
+    """
+
+    in_shard = get_shard_filter(shard, shard_sizes)
+    if approximate:
+        print('STEP 1/3: Sketching reference...')
+        gene_to_clusters_ref = None
+        ref_sketches = sketch_reference(reference_file, sketches_file, max_error, lsh_threshold, seed)
+        clusters_size_ref = dict(zip(ref_sketches['clusters_name'], (int(size) for size in ref_sketches['clusters_size'])))
+    else:
+        print('STEP 1/3: Indexing reference...')
+        ref_sketches = None
+        gene_to_clusters_ref = parse_clusters(read_clusters(reference_file))
+        clusters_size_ref = count_clusters_size(gene_to_clusters_ref)
+
+    print('STEP 2/3: Comparing {0} queries to the reference...'.format(len(query_files)))
+    tasks = [(query_file, shard_path(output_file, shard), query_min_cluster_size, with_similarities)
+        for query_file, output_file in zip(query_files, output_files)]
+
+    queries_summary = fork_map(compare_query, tasks, threads, gene_to_clusters_ref=gene_to_clusters_ref,
+        ref_sketches=ref_sketches, clusters_size_ref=clusters_size_ref, in_shard=in_shard)
+
+    print('STEP 3/3: Writing summary...')
+    queries_summary = rank_queries(queries_summary)
+    for rank, query_summary in enumerate(queries_summary, start=1):
+        print("{0}. {1} ({2:.2%})".format(rank, query_summary[0], query_summary[-1]))
+    if summary_file:
+        write_summary(queries_summary, shard_path(summary_file, shard), estimated=approximate)
+
+    if shard:
+        outputs = [{'kind': 'comparison_report', 'path': task[1], 'target': output_file}
+            for task, output_file in zip(tasks, output_files)]
+        if summary_file:
+            outputs.append({'kind': 'comparison_summary', 'path': shard_path(summary_file, shard), 'target': summary_file})
+        write_manifest(shard_path(manifest_prefix or output_files[0], shard) + '.manifest.json', script, shard, outputs)
+
+    return queries_summary
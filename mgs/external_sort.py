@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""External sort and merge join for inputs which do not fit in memory."""
+
+from __future__ import print_function
+import argparse
+import cPickle as pickle
+import heapq
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+SIZE_UNITS = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+
+# Maximum number of runs merged at once. Runs are closed until they are merged and
+# above this value they are merged in several passes, so that a merge opens at most
+# this number of files.
+MAX_MERGE_FAN_IN = 128
+
+def memory_size(value):
+    """Parse a memory size such as 512M or 4G into a number of bytes.
+    """
+
+    value = value.strip().upper().rstrip('B')
+    try:
+        if value and value[-1] in SIZE_UNITS:
+            size = int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+        else:
+            size = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("{0} is not a valid memory size.".format(value))
+
+    if size <= 0:
+        raise argparse.ArgumentTypeError("memory size must be positive.")
+
+    return size
+
+def record_size(record):
+    """ Estimate the memory footprint of a record made of possibly nested tuples of values.
+
+    Nested tuples, such as (header, sequence) FASTA entries or (line number, line)
+    profile rows, are measured recursively so that their strings are accounted for.
+    """
+
+    if isinstance(record, tuple):
+        return sys.getsizeof(record) + sum(record_size(item) for item in record)
+
+    return sys.getsizeof(record)
+
+def write_run(records, run_dir):
+    """ Write sorted records to a new file of run_dir and return its path. The file is closed once written.
+    """
+
+    fd, run = tempfile.mkstemp(suffix='.run', dir=run_dir)
+    with os.fdopen(fd, 'wb') as ostream:
+        for record in records:
+            pickle.dump(record, ostream, pickle.HIGHEST_PROTOCOL)
+    return run
+
+def read_run(run):
+    """ Read back the records of a run written by write_run and remove it once read.
+    """
+
+    with open(run, 'rb') as istream:
+        while True:
+            try:
+                yield pickle.load(istream)
+            except EOFError:
+                break
+    os.remove(run)
+
+def merge_runs(runs, run_dir):
+    """ Merge sorted runs into a single sorted stream of records and remove run_dir once they are read.
+    """
+
+    try:
+        while len(runs) > MAX_MERGE_FAN_IN:
+            runs = [write_run(heapq.merge(*[read_run(run) for run in runs[i:i+MAX_MERGE_FAN_IN]]), run_dir)
+                    for i in xrange(0, len(runs), MAX_MERGE_FAN_IN)]
+
+        for record in heapq.merge(*[read_run(run) for run in runs]):
+            yield record
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+def external_sort(records, memory_limit, tmp_dir=None, spill=False):
+    """ Sort tuples according to their natural order using at most about memory_limit bytes.
+
+    Records are accumulated into bounded-size runs which are sorted in memory,
+    spilled to a directory of tmp_dir and finally merged. If all records fit in
+    a single run, nothing is written to disk unless spill is set. Set spill when
+    the sorted records feed another sort, so that its buffer is released before
+    the next one is filled.
+    """
+
+    run_dir = tempfile.mkdtemp(prefix='mgs_sort_', dir=tmp_dir)
+    runs = []
+    buf, buf_size = [], 0
+
+    try:
+        for record in records:
+            buf.append(record)
+            buf_size += record_size(record)
+            if buf_size >= memory_limit:
+                buf.sort()
+                runs.append(write_run(buf, run_dir))
+                buf, buf_size = [], 0
+
+        buf.sort()
+        if runs or spill:
+            if buf:
+                runs.append(write_run(buf, run_dir))
+            buf = None
+    except:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        raise
+
+    if buf is not None:
+        os.rmdir(run_dir)
+        return iter(buf)
+
+    return merge_runs(runs, run_dir)
+
+def merge_join(left, right):
+    """ Join two streams of (key, value) pairs sorted by key.
+
+    Yields (left value, key, right value) for each pair of records sharing the
+    same key. Keys may be repeated in both streams.
+    """
+
+    left = iter(left)
+    pending = next(left, None)
+    group_key, group = None, []
+
+    for key, right_value in right:
+        if not group or key != group_key:
+            while pending is not None and pending[0] < key:
+                pending = next(left, None)
+
+            group_key, group = key, []
+            while pending is not None and pending[0] == key:
+                group.append(pending[1])
+                pending = next(left, None)
+
+        for left_value in group:
+            yield left_value, key, right_value
+
+def count_by_first(records, counts):
+    """ Yield records unchanged while counting them by their first field in counts.
+    """
+
+    for record in records:
+        counts[record[0]] += 1
+        yield record
+
+def group_by_first(records):
+    """ Group consecutive records by their first field.
+
+    Yields (first field, iterator over the last fields) pairs. Records are read lazily so that
+    a group never has to fit in memory, each iterator must be consumed before the next pair.
+    """
+
+    for key, group in itertools.groupby(records, key=lambda record: record[0]):
+        yield key, (record[-1] for record in group)
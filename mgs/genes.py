@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+"""Extraction of the genes of clusters and of their statistics from a genes catalog."""
+
+from __future__ import print_function
+import bisect
+import os
+import sys
+import time
+from array import array
+from collections import defaultdict
+from mgs.checkpoint import (get_checkpoint_interval, fingerprint, new_state, load_checkpoint, save_checkpoint, remove_checkpoint,
+        restore_clusters_files, flush_clusters_buffers, finalize_clusters_files)
+from mgs.clusters import parse_clusters, sort_clusters
+from mgs.parallel import fork_map
+from mgs.pipelines import dispatch_clusters_records, filter_clusters_size, join_clusters_records
+from mgs.readers import read_clusters, read_genes_catalog
+from mgs.sharding import get_shard_filter, shard_path, write_manifest
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+START_CODONS = ('ATG', 'GTG', 'TTG')
+STOP_CODONS = ('TAA', 'TAG', 'TGA')
+
+# Maximum size of the byte ranges of the catalog whose genes statistics are computed at once
+MAX_RANGE_SIZE = 1 << 28
+
+def parse_fasta_range(istream, start, end):
+    """ Same as parse_fasta but restricted to entries whose header starts in the byte range [start, end).
+    """
+
+    for _, fasta_entry in parse_fasta_offsets(istream, start, end):
+        yield fasta_entry
+
+def parse_fasta_offsets(istream, start, end):
+    """ Same as parse_fasta_range but also yields the offset at which the entry following each entry starts.
+    """
+
+    if start > 0:
+        istream.seek(start-1)
+        offset = start-1 + len(istream.readline())
+    else:
+        istream.seek(0)
+        offset = 0
+
+    header, seq = None, []
+    while True:
+        line = istream.readline()
+        if not line or (line.startswith(">") and offset >= end):
+            break
+        line_offset = offset
+        offset += len(line)
+
+        line = line.rstrip()
+        if line.startswith(">"):
+            if header: yield line_offset, (header, ''.join(seq))
+            header, seq = line, []
+        else:
+            seq.append(line)
+    if header: yield offset, (header, ''.join(seq))
+
+def split_genes_catalog(genes_catalog, num_ranges):
+    """ Split the genes catalog into byte ranges of equal size.
+    """
+
+    catalog_size = os.path.getsize(genes_catalog)
+    bounds = [catalog_size * i // num_ranges for i in xrange(num_ranges+1)]
+    return zip(bounds[:-1], bounds[1:])
+
+def compute_gene_stats(seq):
+    """ Compute the length, number of G/C, number of A/C/G/T and incompleteness of a gene.
+
+    A gene is a complete ORF if it starts with a start codon, ends with a stop codon and its length is a multiple of 3.
+    """
+
+    seq = seq.upper()
+    gc_count = seq.count('G') + seq.count('C')
+    acgt_count = gc_count + seq.count('A') + seq.count('T')
+    is_complete = len(seq) % 3 == 0 and seq[:3] in START_CODONS and seq[-3:] in STOP_CODONS
+
+    return len(seq), gc_count, acgt_count, 0 if is_complete else 1
+
+def compute_genes_stats_range(task):
+    """ Compute the statistics of all the genes of a byte range of the genes catalog.
+
+    Returns the number of genes of the range and an array in which the statistics of its i-th gene are the items 4*i to 4*i+3.
+    """
+
+    genes_catalog, catalog_range = task
+
+    genes_stats = array('l')
+    with open(genes_catalog, 'rb') as istream:
+        for header, seq in parse_fasta_range(istream, *catalog_range):
+            genes_stats.extend(compute_gene_stats(seq))
+
+    return len(genes_stats) // 4, genes_stats
+
+def compute_clusters_stats(genes_catalog, gene_to_clusters, threads):
+    """ Compute in one pass over the genes catalog the statistics of each cluster.
+
+    The catalog is split into byte ranges whose genes are processed in parallel. Ranges are merged
+    in order so that their genes are numbered as in a sequential scan and added to their clusters.
+    """
+
+    num_ranges = max(4*threads if threads > 1 else 1, os.path.getsize(genes_catalog) // MAX_RANGE_SIZE + 1)
+    tasks = [(genes_catalog, catalog_range) for catalog_range in split_genes_catalog(genes_catalog, num_ranges)]
+    clustered_genes = sorted(gene_to_clusters)
+
+    clusters_stats = dict()
+    first_gene_num = 1
+    # Ranges come in order so the clustered genes of a range start where the ones of the previous range end
+    end = bisect.bisect_left(clustered_genes, first_gene_num)
+    for range_num_genes, genes_stats in fork_map(compute_genes_stats_range, tasks, threads):
+        start, end = end, bisect.bisect_left(clustered_genes, first_gene_num + range_num_genes, end)
+        for gene_num in clustered_genes[start:end]:
+            i = 4 * (gene_num - first_gene_num)
+            gene_stats = genes_stats[i:i+4]
+            for cluster_name in gene_to_clusters[gene_num]:
+                if cluster_name in clusters_stats:
+                    cluster_stats = clusters_stats[cluster_name]
+                    cluster_stats[0] += 1
+                    for j, value in enumerate(gene_stats, start=1):
+                        cluster_stats[j] += value
+                else:
+                    clusters_stats[cluster_name] = [1] + list(gene_stats)
+        first_gene_num += range_num_genes
+
+    return clusters_stats
+
+def write_clusters_stats(stats_file, clusters_stats, min_cluster_size):
+    with open(stats_file, 'w') as ostream:
+        print("cluster\tgenes\ttotal_length\tmean_length\tgc_content\tincomplete_orfs", file=ostream)
+        for cluster_name in sorted(clusters_stats):
+            num_genes, total_length, gc_count, acgt_count, num_incomplete = clusters_stats[cluster_name]
+
+            if num_genes < min_cluster_size:
+                continue
+
+            gc_content = "{0:.4f}".format(float(gc_count) / acgt_count) if acgt_count else 'NA'
+            print("{0}\t{1}\t{2}\t{3:.1f}\t{4}\t{5:.4f}".format(cluster_name, num_genes, total_length,
+                float(total_length) / num_genes, gc_content, float(num_incomplete) / num_genes), file=ostream)
+
+
+def extract_clusters_genes_checkpointed(genes_catalog, gene_to_clusters, output_dir, state, checkpoint_file, checkpoint_interval):
+    """ Read the genes catalog from the offset of the state and append the genes of each cluster to its temporary file.
+
+    Genes are buffered in memory and written at each checkpoint, together with the offset reached in the catalog.
+    """
+
+    def cluster_file(cluster_name):
+        return os.path.join(output_dir, cluster_name + '.fna')
+
+    if state.get('finalizing'):
+        # The run was stopped while renaming the clusters files, which only have to be finalized
+        return cluster_file
+
+    restore_clusters_files(state['clusters'], cluster_file)
+
+    clusters_buffers = defaultdict(list)
+    last_checkpoint = time.time()
+
+    with open(genes_catalog, 'rb') as istream:
+        gene_num = state['num_records']
+        for next_offset, (header, seq) in parse_fasta_offsets(istream, state['offset'], os.path.getsize(genes_catalog)):
+            gene_num += 1
+            if gene_num in gene_to_clusters:
+                for cluster_name in gene_to_clusters[gene_num]:
+                    clusters_buffers[cluster_name].append("{0}\n{1}\n".format(header,seq))
+
+            if time.time() - last_checkpoint >= checkpoint_interval:
+                flush_clusters_buffers(clusters_buffers, state['clusters'], cluster_file)
+                state['offset'], state['num_records'] = next_offset, gene_num
+                save_checkpoint(checkpoint_file, state)
+                last_checkpoint = time.time()
+
+    flush_clusters_buffers(clusters_buffers, state['clusters'], cluster_file)
+
+    return cluster_file
+
+def write_clusters_genes(output_dir, clusters_genes):
+    written_files = []
+
+    for cluster_name, cluster_genes in clusters_genes:
+        output_file = os.path.join(output_dir, cluster_name + '.fna')
+
+        with open(output_file, 'w') as ostream:
+            for header,seq in cluster_genes:
+                print("{0}\n{1}".format(header,seq), file=ostream)
+        written_files.append(os.path.basename(output_file))
+
+    return written_files
+
+def run_clusters_stats(clusters_file, genes_catalog, stats_file, min_cluster_size=1, threads=1, shard=None, shard_sizes=None, script=None):
+    """ Compute the statistics of the clusters of clusters_file from the genes catalog and write them to stats_file.
+
+    Statistics are always computed in memory, by up to threads processes. A ValueError is raised if threads is below 1.
+    With shard, stats_file is replaced by a shard-local file.
+    """
+
+    if threads < 1:
+        raise ValueError('The number of threads must be at least 1.')
+
+    in_shard = get_shard_filter(shard, shard_sizes)
+    print('STEP 1/3: Reading clusters file...')
+    gene_to_clusters = parse_clusters(read_clusters(clusters_file, int, in_shard))
+    print('STEP 2/3: Computing clusters statistics from genes catalog...')
+    clusters_stats = compute_clusters_stats(genes_catalog, gene_to_clusters, threads)
+    print('STEP 3/3: Writing clusters statistics...')
+    shard_stats_file = shard_path(stats_file, shard)
+    write_clusters_stats(shard_stats_file, clusters_stats, min_cluster_size)
+    if shard:
+        write_manifest(shard_stats_file + '.manifest.json', script, shard,
+            [{'kind': 'clusters_stats', 'path': shard_stats_file, 'target': stats_file}])
+
+def run_clusters_genes(clusters_file, genes_catalog, output_dir='.', min_cluster_size=1, memory_limit=None, tmp_dir=None,
+        checkpoint_interval=None, resume=False, shard=None, shard_sizes=None, script=None):
+    """ Write the genes of each cluster of clusters_file to <cluster name>.fna in output_dir and return the names of the written files.
+
+    Runs out-of-core with memory_limit, or writes clusters files progressively and saves checkpoints
+    every checkpoint_interval seconds. With resume, the run continues from the last checkpoint and
+    a ValueError is raised if it was written for other inputs. Checkpoints can not be combined with
+    memory_limit. With shard, checkpoints are kept per shard.
+    """
+
+    checkpoint_interval = get_checkpoint_interval(checkpoint_interval, resume, memory_limit)
+
+    in_shard = get_shard_filter(shard, shard_sizes)
+    print('STEP 1/3: Reading clusters file...')
+    if memory_limit:
+        sorted_clusters = sort_clusters(read_clusters(clusters_file, int, in_shard), memory_limit, tmp_dir)
+    else:
+        gene_to_clusters = parse_clusters(read_clusters(clusters_file, int, in_shard))
+
+    if checkpoint_interval is not None:
+        checkpoint_file = shard_path(os.path.join(output_dir, 'clusters_genes'), shard) + '.checkpoint'
+        run_fingerprint = fingerprint([clusters_file, genes_catalog], shard=shard, shard_sizes=shard_sizes)
+        state = load_checkpoint(checkpoint_file, run_fingerprint) if resume else None
+        if state and state.get('finalizing'):
+            print('STEP 2/3: Resuming the renaming of clusters genes files...')
+        elif state:
+            print('STEP 2/3: Resuming extraction of clusters genes after gene {0}...'.format(state['num_records']))
+        else:
+            state = new_state(run_fingerprint)
+            print('STEP 2/3: Extracting clusters genes from genes catalog...')
+        cluster_file = extract_clusters_genes_checkpointed(genes_catalog, gene_to_clusters, output_dir,
+                state, checkpoint_file, checkpoint_interval)
+        print('STEP 3/3: Writing clusters genes...')
+        written_files = finalize_clusters_files(state, checkpoint_file, cluster_file, min_cluster_size, sys.maxint)
+        remove_checkpoint(checkpoint_file)
+    else:
+        print('STEP 2/3: Extracting clusters genes from genes catalog...')
+        if memory_limit:
+            # Genes of a cluster are ranked by gene number, as in the genes catalog
+            genes = ((gene_num, (gene_num, fasta_entry)) for gene_num, fasta_entry in read_genes_catalog(genes_catalog))
+            clusters_genes = join_clusters_records(sorted_clusters, genes, memory_limit, tmp_dir, min_cluster_size)
+        else:
+            clusters_genes = filter_clusters_size(dispatch_clusters_records(gene_to_clusters, read_genes_catalog(genes_catalog)),
+                    min_cluster_size)
+        print('STEP 3/3: Writing clusters genes...')
+        written_files = write_clusters_genes(output_dir, clusters_genes)
+
+    if shard:
+        write_manifest(shard_path(os.path.join(output_dir, 'clusters_genes'), shard) + '.manifest.json', script, shard,
+            [{'kind': 'cluster_files', 'path': output_dir, 'target': output_dir, 'files': written_files}])
+
+    return written_files
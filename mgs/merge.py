@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""Merge of the outputs of a sharded run into the outputs of a single run."""
+
+from __future__ import print_function
+import heapq
+import json
+import os
+import sys
+from collections import OrderedDict
+from mgs.compare import rank_queries, write_summary
+from mgs.sizes import write_clusters_size
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+def read_manifests(manifest_files):
+    """ Read the manifests of a sharded run and check that they describe all of its shards.
+    """
+
+    manifests = []
+    for manifest_file in manifest_files:
+        with open(manifest_file, 'r') as istream:
+            manifests.append(json.load(istream))
+
+    scripts = set(manifest['script'] for manifest in manifests)
+    if len(scripts) != 1:
+        raise ValueError('Manifests come from different scripts: {0}.'.format(', '.join(sorted(str(script) for script in scripts))))
+
+    num_shards = set(manifest['num_shards'] for manifest in manifests)
+    if len(num_shards) != 1:
+        raise ValueError('Manifests come from runs with different numbers of shards.')
+    num_shards = num_shards.pop()
+
+    shards = sorted(manifest['shard'] for manifest in manifests)
+    if shards != range(1, num_shards+1):
+        missing_shards = sorted(set(range(1, num_shards+1)) - set(shards))
+        if missing_shards:
+            raise ValueError('Missing shards: {0}.'.format(', '.join(str(shard) for shard in missing_shards)))
+        raise ValueError('Some shards are given several times.')
+
+    return sorted(manifests, key=lambda manifest: manifest['shard'])
+
+def group_outputs(manifests):
+    """ Group the shard-local outputs by target, in shard order.
+    """
+
+    targets = OrderedDict()
+    for manifest in manifests:
+        for output in manifest['outputs']:
+            target = targets.setdefault(output['target'], {'kind': output['kind'], 'paths': [], 'files': []})
+            target['paths'].append(output['path'])
+            target['files'].extend(output.get('files', []))
+
+    return targets
+
+def merge_clusters_size(paths, target):
+    clusters_size = dict()
+    for path in paths:
+        with open(path, 'r') as istream:
+            for line in istream:
+                cluster_name, cluster_size = line.split()
+                clusters_size[cluster_name] = int(cluster_size)
+
+    write_clusters_size(clusters_size, 1, sys.maxint, target)
+
+def merge_tables_by_cluster(paths, target):
+    """ Merge tables with a header and one row per cluster, sorted by cluster name.
+
+    A ValueError is raised if shards with rows have different headers. Shards without rows
+    are not compared, since a shard which read no gene may not know the columns of the table.
+    """
+
+    header, header_path, rows = None, None, []
+    for path in paths:
+        with open(path, 'r') as istream:
+            shard_header = next(istream)
+            shard_rows = list(istream)
+
+        if shard_rows:
+            if header_path and shard_header != header:
+                raise ValueError('{0} and {1} have different headers.'.format(header_path, path))
+            header, header_path = shard_header, path
+        elif header is None:
+            header = shard_header
+        rows.extend(shard_rows)
+
+    with open(target, 'w') as ostream:
+        ostream.write(header)
+        ostream.writelines(sorted(rows, key=lambda row: row.split('\t', 1)[0]))
+
+def read_annotation_lines(path, shard_num):
+    """ Yield the (cluster name, shard number, line) of each line of a clusters annotation file.
+    """
+
+    with open(path, 'r') as istream:
+        for line in istream:
+            yield line.split('\t', 1)[0], shard_num, line
+
+def merge_clusters_annotation(paths, target):
+    """ Merge clusters annotation files sorted by cluster name.
+
+    A cluster belongs to a single shard so its lines stay in the order of its shard.
+    """
+
+    shards_lines = [read_annotation_lines(path, shard_num) for shard_num, path in enumerate(paths)]
+
+    with open(target, 'w') as ostream:
+        for _, _, line in heapq.merge(*shards_lines):
+            ostream.write(line)
+
+def merge_comparison_reports(paths, target):
+    """ Merge comparison reports made of one block per query cluster, sorted by decreasing size then name.
+    """
+
+    blocks = []
+    for path in paths:
+        with open(path, 'r') as istream:
+            blocks.extend(block for block in istream.read().split('\n\n') if block)
+
+    def block_key(block):
+        cluster_query, cluster_size = block.split('\n', 1)[0].rsplit(' (', 1)
+        return -int(cluster_size.split()[0]), cluster_query
+
+    with open(target, 'w') as ostream:
+        for block in sorted(blocks, key=block_key):
+            ostream.write(block + '\n\n')
+
+def merge_comparison_summaries(paths, target):
+    queries_counts = OrderedDict()
+    estimated = False
+    for path in paths:
+        with open(path, 'r') as istream:
+            # Summaries of approximate comparisons name the column of unknown genes unattributed_genes
+            estimated = 'unattributed_genes' in next(istream).split('\t')
+            for line in istream:
+                line_items = line.rstrip('\n').split('\t')
+                query_counts = queries_counts.setdefault(line_items[1], [0, 0, 0, 0])
+                for i, count in enumerate(line_items[2:6]):
+                    query_counts[i] += int(count)
+
+    queries_summary = []
+    for query_file, (num_clusters, num_genes, num_unknown_genes, num_matched_genes) in queries_counts.iteritems():
+        agreement = float(num_matched_genes) / num_genes if num_genes else 0.0
+        queries_summary.append((query_file, num_clusters, num_genes, num_unknown_genes, num_matched_genes, agreement))
+
+    write_summary(rank_queries(queries_summary), target, estimated)
+
+def check_cluster_files(target, files):
+    missing_files = [file_name for file_name in files if not os.path.isfile(os.path.join(target, file_name))]
+    if missing_files:
+        raise ValueError('{0} cluster files are missing from {1}, e.g. {2}.'.format(len(missing_files), target, missing_files[0]))
+
+# Merge function of each kind of shard-local output
+MERGE_FUNCS = {
+    'clusters_size': merge_clusters_size,
+    'clusters_stats': merge_tables_by_cluster,
+    'clusters_annotation_summary': merge_tables_by_cluster,
+    'clusters_annotation': merge_clusters_annotation,
+    'comparison_report': merge_comparison_reports,
+    'comparison_summary': merge_comparison_summaries,
+}
+
+def run_merge_shards(manifest_files, output_manifest=None, remove_shards=False):
+    """ Merge the outputs described by the manifests of all the shards of a run into their targets.
+
+    Cluster files are already written to their target directory and are only checked. A ValueError
+    is raised if shards are missing or come from different runs. With remove_shards, shard-local
+    outputs and manifests are removed once merged.
+    """
+
+    print('STEP 1/3: Reading manifests...')
+    manifests = read_manifests(manifest_files)
+    targets = group_outputs(manifests)
+
+    print('STEP 2/3: Merging {0} shards...'.format(len(manifests)))
+    for target, output in targets.iteritems():
+        if output['kind'] == 'cluster_files':
+            check_cluster_files(target, output['files'])
+        else:
+            MERGE_FUNCS[output['kind']](output['paths'], target)
+
+    print('STEP 3/3: Writing merged manifest...')
+    if output_manifest:
+        merged_manifest = {'script': manifests[0]['script'], 'num_shards': manifests[0]['num_shards'],
+            'outputs': [dict(kind=output['kind'], target=target, **({'files': sorted(output['files'])} if output['files'] else {}))
+                for target, output in targets.iteritems()]}
+        with open(output_manifest, 'w') as ostream:
+            json.dump(merged_manifest, ostream, indent=2, sort_keys=True)
+
+    if remove_shards:
+        for target, output in targets.iteritems():
+            if output['kind'] != 'cluster_files':
+                for path in output['paths']:
+                    os.remove(path)
+        for manifest_file in manifest_files:
+            os.remove(manifest_file)
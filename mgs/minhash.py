@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+"""One permutation MinHash sketches of clusters and LSH banding to find similar clusters quickly."""
+
+from __future__ import print_function
+import itertools
+import json
+import math
+import os
+import zlib
+from array import array
+import numpy as np
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+# Number of lines of a clusters file whose genes are hashed at once when sketching its clusters
+CHUNK_SIZE = 1 << 16
+
+# Number of signatures densified at once
+DENSIFY_CHUNK_SIZE = 1 << 12
+
+# Number of pairs of signatures compared at once
+PAIRS_CHUNK_SIZE = 1 << 14
+
+# Value of the bins which no gene of a cluster hashes to. A gene with this value is also
+# taken as missing, which only makes its bin densified in all the clusters which contain it.
+EMPTY_BIN = np.iinfo(np.uint32).max
+
+# Odd constant added to borrowed values for each bin skipped by densification
+DENSIFY_OFFSET = 0x9e3779b1
+
+UINT64_MASK = (1 << 64) - 1
+
+def num_bins_for_error(max_error, confidence=0.95):
+    """ Number of bins of sketches so that a Jaccard estimate is within max_error of the true value with the given confidence.
+
+    The standard error of the estimate is sqrt(J(1-J)/k), which is at most 1/(2 sqrt(k)). Clusters with
+    fewer genes than bins have densified signatures whose estimates are less precise.
+    """
+
+    z = {0.90: 1.645, 0.95: 1.960, 0.99: 2.576}[confidence]
+    return int(math.ceil((z / (2 * max_error))**2))
+
+def choose_bands(num_bins, threshold):
+    """ Choose the number of bands and of rows per band so that pairs of clusters with a Jaccard
+    index around threshold have a probability of 1/2 to become candidates.
+    """
+
+    best = None
+    for rows in xrange(1, num_bins+1):
+        bands = num_bins // rows
+        error = abs((1.0 / bands)**(1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+
+    return best[1], best[2]
+
+def hash_genes(genes_crc, seed):
+    """ Mix the CRC32 of gene names and the seed into 64-bit hashes with the splitmix64 finalizer.
+    """
+
+    # Products overflow on purpose: hashes are computed modulo 2^64
+    hashes = genes_crc.astype(np.uint64) + np.uint64((seed * 0x9e3779b97f4a7c15) & UINT64_MASK)
+    hashes ^= hashes >> np.uint64(30)
+    hashes *= np.uint64(0xbf58476d1ce4e5b9)
+    hashes ^= hashes >> np.uint64(27)
+    hashes *= np.uint64(0x94d049bb133111eb)
+    hashes ^= hashes >> np.uint64(31)
+
+    return hashes
+
+def sketch_chunk(signatures, clusters_ids, hashes):
+    """ Update the signatures of clusters with a chunk of genes given by the ids of their clusters and their hashes.
+
+    The high bits of the hash of a gene choose its bin and the low bits are its value, so each gene is hashed once
+    (one permutation hashing). Each bin of a signature keeps the minimum value of the genes of the cluster in that bin.
+    """
+
+    num_bins = signatures.shape[1]
+    bins = ((hashes >> np.uint64(32)) * np.uint64(num_bins)) >> np.uint64(32)
+    cells = clusters_ids * num_bins + bins.astype(np.int64)
+    values = (hashes & np.uint64(0xffffffff)).astype(np.uint32)
+
+    # Sort by cell then by value so that the first value of each cell is its minimum
+    order = np.lexsort((values, cells))
+    cells, values = cells[order], values[order]
+    is_first = np.ones(len(cells), dtype=bool)
+    is_first[1:] = cells[1:] != cells[:-1]
+    cells, values = cells[is_first], values[is_first]
+
+    flat_signatures = signatures.reshape(-1)
+    flat_signatures[cells] = np.minimum(flat_signatures[cells], values)
+
+def densify(signatures):
+    """ Fill the empty bins of signatures, which are frequent for clusters with fewer genes than bins.
+
+    An empty bin takes the value of the next non-empty bin on its right, circularly, plus an offset for
+    each skipped bin (rotation densification). Two clusters whose bins are filled from the same bin at
+    the same distance get equal values, so the fraction of equal bins still estimates their Jaccard index.
+    Signatures must have at least one non-empty bin.
+    """
+
+    num_bins = signatures.shape[1]
+    positions = np.arange(2*num_bins)
+
+    for start in xrange(0, len(signatures), DENSIFY_CHUNK_SIZE):
+        chunk = signatures[start:start+DENSIFY_CHUNK_SIZE]
+        is_empty = chunk == EMPTY_BIN
+        if not is_empty.any():
+            continue
+
+        # Bins are repeated once so that the next non-empty bin of the last bins is found circularly
+        is_full = np.hstack((~is_empty, ~is_empty))
+        next_full = np.where(is_full, positions, 2*num_bins)
+        next_full = np.minimum.accumulate(next_full[:, ::-1], axis=1)[:, ::-1][:, :num_bins]
+        distances = next_full - positions[:num_bins]
+
+        borrowed = np.take_along_axis(chunk, next_full % num_bins, axis=1).astype(np.uint64)
+        borrowed = (borrowed + distances.astype(np.uint64) * np.uint64(DENSIFY_OFFSET)) & np.uint64(0xffffffff)
+        chunk[is_empty] = borrowed[is_empty].astype(np.uint32)
+
+def sketch_clusters_file(clusters_file, num_bins, seed, min_cluster_size=None, in_shard=None):
+    """ Compute the MinHash signature of each cluster of a clusters file in one streaming pass.
+
+    Lines are read by chunks whose genes are hashed at once, so that no map of genes to clusters is built.
+    Each gene is hashed once whatever the number of bins, so sketching is linear in the number of lines.
+    Returns the sorted names of clusters with at least min_cluster_size genes, their sizes and a matrix with one signature per row.
+    """
+
+    clusters_ids, num_clusters = dict(), 0
+    clusters_size = np.zeros(0, dtype=np.int64)
+    signatures = np.zeros((0, num_bins), dtype=np.uint32)
+
+    with open(clusters_file, 'r') as istream:
+        for chunk in iter(lambda: list(itertools.islice(istream, CHUNK_SIZE)), []):
+            chunk_clusters, chunk_crc = array('l'), array('L')
+            for line in chunk:
+                cluster_name, gene_name = line.split()
+
+                cluster_id = clusters_ids.get(cluster_name)
+                if cluster_id is None:
+                    # Clusters of other shards are given the id -1 and skipped
+                    if not in_shard or in_shard(cluster_name):
+                        cluster_id, num_clusters = num_clusters, num_clusters + 1
+                    else:
+                        cluster_id = -1
+                    clusters_ids[cluster_name] = cluster_id
+                if cluster_id < 0:
+                    continue
+
+                chunk_clusters.append(cluster_id)
+                chunk_crc.append(zlib.crc32(gene_name) & 0xffffffff)
+
+            if not chunk_clusters:
+                continue
+
+            if num_clusters > len(clusters_size):
+                num_new = max(num_clusters, 2*len(clusters_size)) - len(clusters_size)
+                clusters_size = np.concatenate((clusters_size, np.zeros(num_new, dtype=np.int64)))
+                signatures = np.vstack((signatures, np.full((num_new, num_bins), EMPTY_BIN, dtype=np.uint32)))
+
+            chunk_clusters = np.frombuffer(chunk_clusters, dtype=np.dtype('l')).astype(np.int64)
+            clusters_size += np.bincount(chunk_clusters, minlength=len(clusters_size))
+            sketch_chunk(signatures, chunk_clusters, hash_genes(np.frombuffer(chunk_crc, dtype=np.dtype('L')), seed))
+
+    clusters_name = sorted(cluster_name for cluster_name, cluster_id in clusters_ids.iteritems()
+            if cluster_id >= 0 and clusters_size[cluster_id] >= (min_cluster_size or 1))
+    selected = np.array([clusters_ids[cluster_name] for cluster_name in clusters_name], dtype=np.int64)
+
+    signatures = signatures[selected]
+    densify(signatures)
+
+    return clusters_name, clusters_size[selected], signatures
+
+def save_sketches(sketches_file, clusters_name, clusters_size, signatures, sketches_fingerprint):
+    """ Save the sketches of a clusters file so that it only needs to be sketched once.
+    """
+
+    with open(sketches_file, 'wb') as ostream:
+        np.savez(ostream, clusters_name=np.array(clusters_name), clusters_size=clusters_size, signatures=signatures,
+                fingerprint=np.array(json.dumps(sketches_fingerprint, sort_keys=True)))
+
+def load_sketches(sketches_file, sketches_fingerprint):
+    """ Load sketches saved by save_sketches, or None if they do not exist or were computed from other inputs.
+    """
+
+    if not os.path.isfile(sketches_file):
+        return None
+
+    sketches = np.load(sketches_file)
+    if str(sketches['fingerprint']) != json.dumps(sketches_fingerprint, sort_keys=True):
+        return None
+
+    return list(sketches['clusters_name']), sketches['clusters_size'], sketches['signatures']
+
+def band_keys(signatures, bands, rows):
+    """ Hash the rows of each band of signatures into one 64-bit key, for all the signatures at once.
+    """
+
+    banded = signatures[:, :bands*rows].reshape(len(signatures), bands, rows)
+    keys = np.zeros((len(signatures), bands), dtype=np.uint64)
+    # FNV-1a over the values of the rows of each band, products overflow on purpose
+    for row in xrange(rows):
+        keys ^= banded[:, :, row].astype(np.uint64)
+        keys *= np.uint64(0x100000001b3)
+
+    return keys
+
+def build_lsh_index(signatures, bands, rows):
+    """ Index signatures by band so that clusters sharing a band can be found without comparing all pairs.
+
+    Returns the keys of each band sorted independently and the indices of the signatures in that order.
+    """
+
+    keys = band_keys(signatures, bands, rows)
+    order = np.argsort(keys, axis=0, kind='mergesort')
+
+    return np.take_along_axis(keys, order, axis=0), order
+
+def find_candidates(lsh_index, signatures, bands, rows):
+    """ Find the pairs of signatures and indexed signatures which share at least one band.
+
+    Returns the sorted indices of the signatures and, for each of them, the index of an indexed signature.
+    """
+
+    sorted_keys, order = lsh_index
+    num_indexed = len(order)
+    keys = band_keys(signatures, bands, rows)
+
+    pairs = [np.zeros(0, dtype=np.int64)]
+    for band in xrange(bands):
+        starts = np.searchsorted(sorted_keys[:, band], keys[:, band], side='left')
+        counts = np.searchsorted(sorted_keys[:, band], keys[:, band], side='right') - starts
+        # The k-th match overall is at position k plus the start of its signature minus the matches of the previous signatures
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        pairs.append(np.repeat(np.arange(len(keys), dtype=np.int64), counts) * num_indexed + order[positions, band])
+
+    pairs = np.unique(np.concatenate(pairs))
+
+    return pairs // num_indexed, pairs % num_indexed
+
+def estimate_jaccard(signatures_query, signatures_ref, queries, refs):
+    """ Estimate the Jaccard index of pairs of clusters by the fraction of equal bins of their signatures.
+
+    The i-th pair is made of the queries[i]-th row of signatures_query and of the refs[i]-th row of signatures_ref.
+    """
+
+    jaccards = np.empty(len(queries), dtype=np.float64)
+    for start in xrange(0, len(queries), PAIRS_CHUNK_SIZE):
+        end = start + PAIRS_CHUNK_SIZE
+        jaccards[start:end] = np.mean(signatures_query[queries[start:end]] == signatures_ref[refs[start:end]], axis=1)
+
+    return jaccards
+
+def estimate_overlap(jaccard, size_query, size_ref):
+    """ Estimate the number of genes shared by pairs of clusters from their Jaccard index and sizes.
+
+    The overlap is J/(1+J) times the sum of sizes.
+    """
+
+    return np.rint(jaccard / (1 + jaccard) * (size_query + size_ref)).astype(np.int64)
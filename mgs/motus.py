@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""Extraction of the mOTUs of clusters from a mOTUs file."""
+
+from __future__ import print_function
+import os
+from mgs.clusters import group_clusters
+from mgs.readers import read_clusters
+from mgs.sharding import get_shard_filter, shard_path, write_manifest
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2015, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+def parse_motus_file(motus_file):
+    """ Read the mOTUs file 
+    """
+
+    all_motus = set()
+    gene_to_motu = dict()
+
+    with open(motus_file, 'r') as istream:
+        for line in istream:
+            line_items = line.split()
+            gene_name, motu_name = line_items[0], line_items[-1]
+            all_motus.add(motu_name)
+            gene_to_motu[gene_name] = motu_name
+    
+    return sorted(all_motus), gene_to_motu
+
+def extract_clusters_motus(cluster_to_genes, all_motus, gene_to_motu):
+    cluster_motus = dict()
+    for cluster, cluster_genes in cluster_to_genes.items():
+
+        cluster_motus[cluster] = dict((motu_name,[]) for motu_name in all_motus)
+
+        for gene_name in cluster_genes:
+            if gene_name in gene_to_motu:
+                cluster_motus[cluster][gene_to_motu[gene_name]].append(gene_name)
+
+    return cluster_motus
+
+def write_clusters_motus(output_dir, cluster_to_genes, cluster_motus, all_motus):
+    written_files = []
+
+    for cluster_name, cluster_genes in cluster_to_genes.items():
+
+        output_file = os.path.join(output_dir, cluster_name + '.mOTUs.txt')
+
+        with open(output_file, 'w') as ostream:
+            for motu in all_motus:
+                print("{0}={1}".format(motu,','.join(cluster_motus[cluster_name][motu])), file=ostream)
+        written_files.append(os.path.basename(output_file))
+
+    return written_files
+
+def run_clusters_motus(clusters_file, motus_file, output_dir='.', min_cluster_size=1, shard=None, shard_sizes=None, script=None):
+    """ Write the mOTUs of the genes of each cluster of clusters_file to <cluster name>.mOTUs.txt in output_dir
+    and return the names of the written files.
+    """
+
+    print('STEP 1/3: Reading clusters file...')
+    cluster_to_genes = group_clusters(read_clusters(clusters_file, in_shard=get_shard_filter(shard, shard_sizes)), min_cluster_size)
+    print('STEP 2/4: Reading mOTUs file...')
+    all_motus, gene_to_motu = parse_motus_file(motus_file)
+    print('STEP 3/4: Extracting clusters mOTUs...')
+    cluster_motus = extract_clusters_motus(cluster_to_genes, all_motus, gene_to_motu)
+    print('STEP 4/4: Writing clusters mOTUs...')
+    written_files = write_clusters_motus(output_dir, cluster_to_genes, cluster_motus, all_motus)
+    if shard:
+        write_manifest(shard_path(os.path.join(output_dir, 'clusters_motus'), shard) + '.manifest.json', script, shard,
+            [{'kind': 'cluster_files', 'path': output_dir, 'target': output_dir, 'files': written_files}])
+
+    return written_files
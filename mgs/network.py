@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""Correlation network of clusters computed by tiles from their representative profiles (requires NumPy)."""
+
+from __future__ import print_function
+import sys
+from collections import defaultdict
+import numpy as np
+from mgs.clusters import parse_clusters
+from mgs.readers import read_clusters, read_profiles
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+def compute_representative_profiles(profiles_file, with_header, gene_to_clusters, min_cluster_size, max_cluster_size, representative):
+    """ Read the profiles table and summarize the profiles of the genes of each cluster.
+
+    Returns the sorted names of the clusters and a matrix with one representative profile per row.
+    The mean is accumulated while reading the profiles table whereas the median requires to keep
+    the profiles of all the genes of the clusters.
+    """
+
+    clusters_profiles = defaultdict(list)
+    clusters_sum, clusters_size = dict(), defaultdict(int)
+
+    for gene_name, line in read_profiles(profiles_file, with_header):
+        if gene_name in gene_to_clusters:
+            profile = np.array(line.split()[1:], dtype=np.float32)
+            for cluster_name in gene_to_clusters[gene_name]:
+                clusters_size[cluster_name] += 1
+                if representative == 'mean':
+                    if cluster_name in clusters_sum:
+                        clusters_sum[cluster_name] += profile
+                    else:
+                        clusters_sum[cluster_name] = profile.astype(np.float64)
+                else:
+                    clusters_profiles[cluster_name].append(profile)
+
+    clusters_name = sorted(cluster_name for cluster_name, cluster_size in clusters_size.iteritems()
+            if min_cluster_size <= cluster_size <= max_cluster_size)
+
+    if representative == 'mean':
+        profiles = [clusters_sum[cluster_name] / clusters_size[cluster_name] for cluster_name in clusters_name]
+    else:
+        profiles = [np.median(clusters_profiles[cluster_name], axis=0) for cluster_name in clusters_name]
+
+    return clusters_name, np.array(profiles, dtype=np.float32)
+
+def rank_profiles(profiles):
+    """ Replace the values of each profile by their ranks, tied values getting the average of their ranks.
+
+    Profiles are mostly made of zeros so tied values must share the same rank for Spearman correlations to be meaningful.
+    """
+
+    num_samples = profiles.shape[1]
+    order = profiles.argsort(axis=1, kind='mergesort')
+    sorted_profiles = np.take_along_axis(profiles, order, axis=1)
+    positions = np.broadcast_to(np.arange(num_samples), profiles.shape)
+
+    # Positions of the first and last values of the group of tied values of each sorted value
+    is_first = np.ones(profiles.shape, dtype=bool)
+    is_first[:, 1:] = sorted_profiles[:, 1:] != sorted_profiles[:, :-1]
+    is_last = np.ones(profiles.shape, dtype=bool)
+    is_last[:, :-1] = is_first[:, 1:]
+    first = np.maximum.accumulate(np.where(is_first, positions, 0), axis=1)
+    last = np.minimum.accumulate(np.where(is_last, positions, num_samples-1)[:, ::-1], axis=1)[:, ::-1]
+
+    ranks = np.empty(profiles.shape, dtype=np.float32)
+    np.put_along_axis(ranks, order, (first + last) / 2.0, axis=1)
+
+    return ranks
+
+def standardize_profiles(profiles, method):
+    """ Center and scale profiles so that the dot product of two rows is their correlation.
+
+    Profiles without variance are set to 0, so that their correlation with any cluster is 0.
+    Standardized profiles are in float64 so that correlations do not depend on the tiling.
+    """
+
+    if method == 'spearman':
+        profiles = rank_profiles(profiles)
+    profiles = profiles.astype(np.float64)
+
+    profiles = profiles - profiles.mean(axis=1, keepdims=True)
+    norms = np.sqrt((profiles**2).sum(axis=1, keepdims=True))
+    norms[norms == 0] = np.inf
+
+    return profiles / norms
+
+# Number of decimals of the correlations written to the network. Correlations are rounded
+# to them before being compared, so that float rounding errors which depend on the shape
+# of tiles do not change which edges are kept.
+CORRELATION_DECIMALS = 4
+
+# Bytes used per cell of a tile when edges are kept from a threshold: the float64
+# correlations and the boolean mask of the cells at or above the threshold.
+THRESHOLD_CELL_SIZE = 8 + 1
+
+# Bytes used per cell of a tile in top-k mode: the float64 correlations, the float64
+# candidates (best values so far followed by the tile), their float64 partition, the
+# boolean masks of the values above and equal to the k-th value, the int32 running
+# count of equal values and the two boolean masks which combine them.
+TOP_K_CELL_SIZE = 8 + 8 + 8 + 1 + 1 + 4 + 1 + 1
+
+def get_tile_size(memory_limit, num_clusters, cell_size, extra_columns=0):
+    """ Number of rows and columns of a tile so that a tile of cell_size bytes per cell fits in memory_limit.
+
+    The arrays built from a tile can have extra_columns more columns than the tile, e.g. the best candidates of top-k mode.
+    """
+
+    # Largest t such that t * (t + extra_columns) * cell_size <= memory_limit
+    num_cells = float(memory_limit) / cell_size
+    tile_size = int((np.sqrt(extra_columns**2 + 4 * num_cells) - extra_columns) / 2)
+
+    return max(1, min(tile_size, num_clusters))
+
+def compute_tile(row_profiles, col_profiles):
+    """ Compute the correlations between two sets of standardized profiles, rounded to CORRELATION_DECIMALS.
+    """
+
+    tile = np.dot(row_profiles, col_profiles.T)
+    # Correlations which fall on a rounding boundary, such as 0.71875 with few samples, may be
+    # computed just below it in some tiles. Rounding them first to a finer precision removes these errors.
+    np.round(tile, CORRELATION_DECIMALS + 6, out=tile)
+    return np.round(tile, CORRELATION_DECIMALS, out=tile)
+
+def iter_edges_above_threshold(profiles, threshold, tile_size):
+    """ Yield pairs of clusters (i, j, correlation) with i < j and a correlation of at least threshold, sorted by (i, j).
+
+    Only the tiles of the upper triangle of the correlation matrix are computed. The edges of a strip
+    of rows are kept until its last tile so that they are yielded in an order which does not depend on the tiling.
+    """
+
+    num_clusters = profiles.shape[0]
+
+    for row_start in xrange(0, num_clusters, tile_size):
+        row_profiles = profiles[row_start:row_start+tile_size]
+        strip_rows, strip_cols, strip_values = [], [], []
+
+        for col_start in xrange(row_start, num_clusters, tile_size):
+            tile = compute_tile(row_profiles, profiles[col_start:col_start+tile_size])
+            is_edge = tile >= threshold
+            # On diagonal tiles, only the cells above the diagonal are pairs i < j
+            if col_start == row_start:
+                is_edge &= np.triu(np.ones(tile.shape, dtype=bool), 1)
+
+            rows, cols = np.nonzero(is_edge)
+            strip_rows.append(rows)
+            strip_cols.append(col_start + cols)
+            strip_values.append(tile[rows, cols])
+            del tile, is_edge
+
+        # Tiles are in column order so a stable sort by row sorts the edges of the strip by (i, j)
+        rows = np.concatenate(strip_rows)
+        order = rows.argsort(kind='mergesort')
+        for i, j, value in zip(rows[order], np.concatenate(strip_cols)[order], np.concatenate(strip_values)[order]):
+            yield row_start + i, j, value
+
+def select_top_k(values, top_k):
+    """ Select in each row of values the top_k largest values, ties being broken by position.
+
+    Returns a boolean mask with top_k selected values per row. Positions are the same as
+    the column indices of the candidates, so the selection does not depend on the tiling.
+    """
+
+    kth = values.shape[1] - top_k
+    # Copy the k-th values so that the partition is freed at once
+    kth_values = np.partition(values, kth, axis=1)[:, kth].copy()[:, None]
+    above = values > kth_values
+    equal = values == kth_values
+    # Among the values equal to the k-th value, keep the first ones in position order
+    num_equal_kept = top_k - np.count_nonzero(above, axis=1)
+    above |= equal & (np.cumsum(equal, axis=1, dtype=np.int32) <= num_equal_kept[:, None])
+
+    return above
+
+def iter_top_k_edges(profiles, top_k, threshold, tile_size):
+    """ Yield pairs of clusters (i, j, correlation) with i < j where j is one of the top_k neighbours of i or conversely.
+
+    Each strip of rows is compared to all the clusters tile by tile while the best candidates seen
+    so far are kept. Neighbours with the same rounded correlation are ranked by index, so that
+    the edges do not depend on the tile size.
+    """
+
+    num_clusters = profiles.shape[0]
+    top_k = min(top_k, num_clusters-1)
+    edges = dict()
+
+    if top_k < 1:
+        return
+
+    for row_start in xrange(0, num_clusters, tile_size):
+        row_profiles = profiles[row_start:row_start+tile_size]
+        num_rows = row_profiles.shape[0]
+        best_values = np.full((num_rows, 0), -np.inf, dtype=np.float64)
+        best_indices = np.zeros((num_rows, 0), dtype=np.int64)
+
+        for col_start in xrange(0, num_clusters, tile_size):
+            tile = compute_tile(row_profiles, profiles[col_start:col_start+tile_size])
+            # Rows and columns share the same tiling so a cluster only meets itself on diagonal tiles
+            if row_start == col_start:
+                np.fill_diagonal(tile, -np.inf)
+
+            # Best candidates are kept sorted by index and come from previous tiles so
+            # positions of candidates follow their indices
+            values = np.hstack((best_values, tile))
+            del tile
+            num_best = best_values.shape[1]
+            if values.shape[1] > top_k:
+                rows, positions = np.nonzero(select_top_k(values, top_k))
+                rows, positions = rows.reshape(num_rows, top_k), positions.reshape(num_rows, top_k)
+                best_values = values[rows, positions]
+                best_indices = np.where(positions < num_best,
+                        np.take_along_axis(best_indices, np.minimum(positions, num_best-1), axis=1) if num_best else 0,
+                        col_start + positions - num_best)
+            else:
+                best_indices = np.hstack((best_indices, np.broadcast_to(np.arange(col_start, col_start+values.shape[1]-num_best),
+                    (num_rows, values.shape[1]-num_best))))
+                best_values = values
+            del values
+
+        for i in xrange(num_rows):
+            for j, value in zip(best_indices[i], best_values[i]):
+                if threshold is not None and value < threshold:
+                    continue
+                edges[tuple(sorted((row_start+i, int(j))))] = value
+
+    for (i, j), value in sorted(edges.iteritems()):
+        yield i, j, value
+
+def write_edges(output_file, clusters_name, edges):
+    with open(output_file, 'w') as ostream:
+        for i, j, correlation in edges:
+            print('{0}\t{1}\t{2:.{3}f}'.format(clusters_name[i], clusters_name[j], correlation, CORRELATION_DECIMALS), file=ostream)
+
+def run_clusters_network(clusters_file, profiles_file, output_file, with_header=False, min_cluster_size=1, max_cluster_size=sys.maxint,
+        representative='mean', method='pearson', threshold=None, top_k=None, memory_limit=1 << 30):
+    """ Write the edges between clusters of clusters_file whose representative profiles are correlated to output_file.
+
+    Edges are kept if their correlation is at least threshold or, with top_k, if one cluster is among
+    the top_k neighbours of the other. Tiles of the correlation matrix fit in about memory_limit bytes.
+    Clusters with a constant representative profile have no correlation and are left out. A ValueError
+    is raised if neither threshold nor top_k is given, or if top_k is below 1.
+    """
+
+    if threshold is None and top_k is None:
+        raise ValueError('At least one of threshold or top_k is required.')
+    if top_k is not None and top_k < 1:
+        raise ValueError('The number of neighbours top_k must be at least 1.')
+
+    print('STEP 1/4: Reading clusters file...')
+    gene_to_clusters = parse_clusters(read_clusters(clusters_file))
+    print('STEP 2/4: Computing representative profiles of clusters...')
+    clusters_name, profiles = compute_representative_profiles(profiles_file, with_header, gene_to_clusters,
+            min_cluster_size, max_cluster_size, representative)
+    del gene_to_clusters
+    print('STEP 3/4: Standardizing profiles of {0} clusters...'.format(len(clusters_name)))
+    profiles = standardize_profiles(profiles, method)
+    # Constant profiles are standardized to 0 and would only get edges of correlation 0
+    has_variance = np.any(profiles != 0, axis=1)
+    clusters_name = [cluster_name for cluster_name, is_kept in zip(clusters_name, has_variance) if is_kept]
+    profiles = profiles[has_variance]
+    if top_k:
+        tile_size = get_tile_size(memory_limit, len(clusters_name), TOP_K_CELL_SIZE, top_k)
+    else:
+        tile_size = get_tile_size(memory_limit, len(clusters_name), THRESHOLD_CELL_SIZE)
+    print('STEP 4/4: Computing correlations of {0} clusters with varying profiles by tiles of {1} clusters and writing edges...'.format(
+        len(clusters_name), tile_size))
+    if top_k:
+        edges = iter_top_k_edges(profiles, top_k, threshold, tile_size)
+    else:
+        edges = iter_edges_above_threshold(profiles, threshold, tile_size)
+    write_edges(output_file, clusters_name, edges)
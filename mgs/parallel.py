@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""Process pools whose workers share large read-only structures by fork inheritance."""
+
+from __future__ import print_function
+import itertools
+import multiprocessing
+import sys
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+# Marks globals which did not exist before fork_map set them
+_missing = object()
+
+def fork_map(func, tasks, threads, **shared):
+    """ Yield func(task) for each task, in order, using up to threads worker processes.
+
+    Keyword arguments are set as globals of the module of func before the pool is created,
+    so that forked workers inherit them instead of receiving a pickled copy with each task.
+    Previous values of these globals are restored once the results have been consumed, or
+    the generator closed, so that shared structures do not outlive the call.
+    Without several threads or tasks, tasks are processed in the current process.
+    """
+
+    module = sys.modules[func.__module__]
+    previous = dict((name, getattr(module, name, _missing)) for name in shared)
+    for name, value in shared.iteritems():
+        setattr(module, name, value)
+
+    try:
+        tasks = list(tasks)
+        if threads < 2 or len(tasks) < 2:
+            for result in itertools.imap(func, tasks):
+                yield result
+            return
+
+        pool = multiprocessing.Pool(min(threads, len(tasks)))
+        try:
+            for result in pool.imap(func, tasks):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        for name, value in previous.iteritems():
+            if value is _missing:
+                delattr(module, name)
+            else:
+                setattr(module, name, value)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""Lazy pipelines which dispatch genes records to their clusters and compare clusterings.
+
+Inputs are iterables of records, such as the ones yielded by mgs.readers, and outputs
+are generators so that steps can be chained in memory without intermediate files:
+
+    clusters = read_clusters('clusters.txt')
+    profiles = read_profiles('profiles.txt', with_header=True)
+    for cluster_name, rows in filter_clusters_size(iter_cluster_profiles(clusters, profiles), min_cluster_size=50):
+        ...
+"""
+
+from __future__ import print_function
+import itertools
+from collections import defaultdict
+from mgs.clusters import parse_clusters, group_clusters, count_clusters_size
+from mgs.compare import compare_cluster
+from mgs.external_sort import external_sort, merge_join, count_by_first, group_by_first
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+def iter_clusters_records(clusters, records):
+    """ Dispatch (gene, record) pairs to the clusters of each gene.
+
+    Yields (cluster name, records) as soon as all the genes of a cluster have been seen,
+    so that memory stays low when the records of a cluster are close to each other.
+    Clusters with genes missing from records are yielded at the end, sorted by name.
+    """
+
+    for cluster_name, cluster_records in dispatch_clusters_records(parse_clusters(clusters), records):
+        yield cluster_name, cluster_records
+
+def dispatch_clusters_records(gene_to_clusters, records):
+    """ Same as iter_clusters_records with clusters already indexed by mgs.clusters.parse_clusters.
+    """
+
+    clusters_size = count_clusters_size(gene_to_clusters)
+    clusters_records = defaultdict(list)
+
+    for gene, record in records:
+        for cluster_name in gene_to_clusters.get(gene, ()):
+            cluster_records = clusters_records[cluster_name]
+            cluster_records.append(record)
+            if len(cluster_records) == clusters_size[cluster_name]:
+                yield cluster_name, clusters_records.pop(cluster_name)
+
+    for cluster_name in sorted(clusters_records):
+        yield cluster_name, clusters_records[cluster_name]
+
+def join_clusters_records(sorted_clusters, records, memory_limit, tmp_dir=None, min_cluster_size=1, max_cluster_size=None):
+    """ Out-of-core counterpart of dispatch_clusters_records followed by filter_clusters_size.
+
+    Merge-joins (gene, (rank, record)) pairs sorted by gene with the pairs of mgs.clusters.sort_clusters
+    and groups records by cluster with an external sort. The records of a cluster are ordered by rank
+    and yielded lazily, straight from the sorted runs.
+    """
+
+    clusters_size = defaultdict(int)
+    joined = ((cluster_name, rank, record) for cluster_name, _, (rank, record) in merge_join(sorted_clusters, records))
+    # external_sort reads all the joined records before returning so clusters size are known before groups are read
+    clusters_records = external_sort(count_by_first(joined, clusters_size), memory_limit, tmp_dir)
+
+    return filter_clusters_size(group_by_first(clusters_records), min_cluster_size, max_cluster_size, clusters_size)
+
+def iter_cluster_profiles(clusters, profiles):
+    """ Yield (cluster name, profiles lines) from (cluster name, gene name) pairs and (gene name, line) pairs of a profiles table.
+    """
+
+    return iter_clusters_records(clusters, profiles)
+
+def iter_cluster_genes(clusters, genes):
+    """ Yield (cluster name, (header, sequence) entries) from (cluster name, gene number) pairs and (gene number, entry) pairs of a genes catalog.
+    """
+
+    return iter_clusters_records(clusters, genes)
+
+def iter_cluster_annotations(clusters, annotations):
+    """ Yield (cluster name, annotation lines) from (cluster name, gene number) pairs and (gene number, line) pairs of an annotation file.
+    """
+
+    return iter_clusters_records(clusters, annotations)
+
+def filter_clusters_size(clusters_records, min_cluster_size=1, max_cluster_size=None, clusters_size=None):
+    """ Keep the (cluster name, records) pairs whose number of records is within bounds.
+
+    With clusters_size, the number of records of each cluster is taken from it so that
+    records can be lazy iterators, such as the groups of mgs.external_sort.group_by_first.
+    """
+
+    for cluster_name, cluster_records in clusters_records:
+        cluster_size = clusters_size[cluster_name] if clusters_size is not None else len(cluster_records)
+        if cluster_size >= min_cluster_size and (max_cluster_size is None or cluster_size <= max_cluster_size):
+            yield cluster_name, cluster_records
+
+def iter_clusters_size(clusters):
+    """ Yield (cluster name, size) for each group of consecutive pairs of the same cluster.
+
+    Clusters files are usually grouped by cluster so each size is yielded as soon as its cluster ends.
+    """
+
+    for cluster_name, cluster_pairs in itertools.groupby(clusters, key=lambda pair: pair[0]):
+        yield cluster_name, sum(1 for _ in cluster_pairs)
+
+def iter_cluster_comparisons(reference, query, min_cluster_size=1):
+    """ Compare query clusters to reference clusters, both given as (cluster name, gene) pairs.
+
+    Yields (query cluster name, query cluster size, dict of reference cluster name to number of
+    shared genes) for each query cluster with at least min_cluster_size genes. Genes which
+    belong to no reference cluster are counted under None.
+    """
+
+    gene_to_clusters_ref = parse_clusters(reference)
+    cluster_to_genes_query = group_clusters(query, min_cluster_size)
+
+    for cluster_query in sorted(cluster_to_genes_query):
+        genes_query = cluster_to_genes_query[cluster_query]
+        yield cluster_query, len(genes_query), dict(compare_cluster(gene_to_clusters_ref, genes_query))
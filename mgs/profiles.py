@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""Extraction of the profiles of clusters from a profiles table."""
+
+from __future__ import print_function
+import os
+import sys
+import time
+from collections import defaultdict
+from mgs.checkpoint import (get_checkpoint_interval, fingerprint, new_state, load_checkpoint, save_checkpoint, remove_checkpoint,
+        restore_clusters_files, flush_clusters_buffers, finalize_clusters_files)
+from mgs.clusters import parse_clusters, sort_clusters
+from mgs.external_sort import external_sort
+from mgs.pipelines import dispatch_clusters_records, filter_clusters_size, join_clusters_records
+from mgs.readers import read_clusters, read_profiles
+from mgs.sharding import get_shard_filter, shard_path, write_manifest
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+def extract_clusters_profile_out_of_core(profiles_file, with_header, sorted_clusters, memory_limit, tmp_dir,
+        min_cluster_size=1, max_cluster_size=sys.maxint):
+    """ Sort the profiles table by gene name and join it with the sorted clusters out-of-core.
+
+    Profiles of a cluster are ranked by line number so that they are kept in the order of the profiles table.
+    """
+
+    profiles = enumerate(read_profiles(profiles_file, with_header))
+    profiles = external_sort(((gene_name, (line_num, line)) for line_num, (gene_name, line) in profiles), memory_limit, tmp_dir,
+            spill=True)
+
+    return join_clusters_records(sorted_clusters, profiles, memory_limit, tmp_dir, min_cluster_size, max_cluster_size)
+
+def extract_clusters_profile_checkpointed(profiles_file, with_header, gene_to_clusters, output_dir, state, checkpoint_file, checkpoint_interval):
+    """ Read the profiles table from the offset of the state and append the profiles of each cluster to its temporary file.
+
+    Profiles are buffered in memory and written at each checkpoint, together with the offset reached in the profiles table.
+    """
+
+    def cluster_file(cluster_name):
+        return os.path.join(output_dir, cluster_name + '_profile.txt')
+
+    if state.get('finalizing'):
+        # The run was stopped while renaming the clusters files, which only have to be finalized
+        return cluster_file
+
+    restore_clusters_files(state['clusters'], cluster_file)
+
+    clusters_buffers = defaultdict(list)
+    last_checkpoint = time.time()
+
+    with open(profiles_file, 'r') as istream:
+        istream.seek(state['offset'])
+        offset, num_profiles = state['offset'], state['num_records']
+        if with_header and offset == 0:
+            offset += len(istream.readline())
+
+        for line in iter(istream.readline, ''):
+            offset += len(line)
+            num_profiles += 1
+            gene_name = line.split(None,1)[0]
+
+            if gene_name in gene_to_clusters:
+                for cluster_name in gene_to_clusters[gene_name]:
+                    clusters_buffers[cluster_name].append(line)
+
+            if time.time() - last_checkpoint >= checkpoint_interval:
+                flush_clusters_buffers(clusters_buffers, state['clusters'], cluster_file)
+                state['offset'], state['num_records'] = offset, num_profiles
+                save_checkpoint(checkpoint_file, state)
+                last_checkpoint = time.time()
+
+    flush_clusters_buffers(clusters_buffers, state['clusters'], cluster_file)
+
+    return cluster_file
+
+def write_clusters_profile(output_dir, clusters_profile):
+    written_files = []
+
+    for cluster_name, cluster_profile in clusters_profile:
+        output_file = os.path.join(output_dir, cluster_name + '_profile.txt')
+
+        with open(output_file, 'w') as ostream:
+            for line in cluster_profile:
+                ostream.write(line)
+        written_files.append(os.path.basename(output_file))
+
+    return written_files
+
+def run_clusters_profile(clusters_file, profiles_file, output_dir='.', with_header=False, min_cluster_size=1, max_cluster_size=sys.maxint,
+        memory_limit=None, tmp_dir=None, checkpoint_interval=None, resume=False, shard=None, shard_sizes=None, script=None):
+    """ Write the profiles of each cluster of clusters_file to <cluster name>_profile.txt in output_dir and return the names of the written files.
+
+    Runs out-of-core with memory_limit, or writes clusters files progressively and saves checkpoints
+    every checkpoint_interval seconds. With resume, the run continues from the last checkpoint and
+    a ValueError is raised if it was written for other inputs. Checkpoints can not be combined with
+    memory_limit. clusters_file can be - to read clusters from the standard input, except with checkpoints.
+    """
+
+    checkpoint_interval = get_checkpoint_interval(checkpoint_interval, resume, memory_limit)
+    if checkpoint_interval is not None and clusters_file == '-':
+        raise ValueError('Checkpoints are not supported when clusters are read from the standard input.')
+
+    in_shard = get_shard_filter(shard, shard_sizes)
+    print('STEP 1/3: Reading clusters file...')
+    if memory_limit:
+        sorted_clusters = sort_clusters(read_clusters(clusters_file, in_shard=in_shard), memory_limit, tmp_dir)
+    else:
+        gene_to_clusters = parse_clusters(read_clusters(clusters_file, in_shard=in_shard))
+
+    if checkpoint_interval is not None:
+        checkpoint_file = shard_path(os.path.join(output_dir, 'clusters_profile'), shard) + '.checkpoint'
+        run_fingerprint = fingerprint([clusters_file, profiles_file], with_header=with_header, shard=shard, shard_sizes=shard_sizes)
+        state = load_checkpoint(checkpoint_file, run_fingerprint) if resume else None
+        if state and state.get('finalizing'):
+            print('STEP 2/3: Resuming the renaming of clusters profile files...')
+        elif state:
+            print('STEP 2/3: Resuming extraction of clusters profile after profile {0} (byte {1})...'.format(state['num_records'], state['offset']))
+        else:
+            state = new_state(run_fingerprint)
+            print('STEP 2/3: Extracting clusters profile from profiles file...')
+        cluster_file = extract_clusters_profile_checkpointed(profiles_file, with_header, gene_to_clusters,
+                output_dir, state, checkpoint_file, checkpoint_interval)
+        print('STEP 3/3: Writing clusters profile...')
+        written_files = finalize_clusters_files(state, checkpoint_file, cluster_file, min_cluster_size, max_cluster_size)
+        remove_checkpoint(checkpoint_file)
+    else:
+        print('STEP 2/3: Extracting clusters profile from profiles file...')
+        if memory_limit:
+            clusters_profile = extract_clusters_profile_out_of_core(profiles_file, with_header, sorted_clusters, memory_limit, tmp_dir,
+                    min_cluster_size, max_cluster_size)
+        else:
+            clusters_profile = filter_clusters_size(dispatch_clusters_records(gene_to_clusters, read_profiles(profiles_file, with_header)),
+                    min_cluster_size, max_cluster_size)
+        print('STEP 3/3: Writing clusters profile...')
+        written_files = write_clusters_profile(output_dir, clusters_profile)
+
+    if shard:
+        write_manifest(shard_path(os.path.join(output_dir, 'clusters_profile'), shard) + '.manifest.json', script, shard,
+            [{'kind': 'cluster_files', 'path': output_dir, 'target': output_dir, 'files': written_files}])
+
+    return written_files
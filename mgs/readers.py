@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""Lazy readers of the files handled by the scripts.
+
+Each reader yields records one by one so that they can be chained with mgs.pipelines
+without loading whole files in memory.
+"""
+
+from __future__ import print_function
+import sys
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+def read_clusters(clusters_file, gene_key=str, in_shard=None):
+    """ Yield the (cluster name, gene) pairs of a file which contains line by line,
+    tab separated pairs of values <cluster name> <gene name>.
+
+    Genes are converted with gene_key, e.g. int when genes are numbers in a genes catalog.
+    With in_shard, only the pairs of the clusters of the shard are yielded. The clusters
+    file - is the standard input.
+    """
+
+    istream = sys.stdin if clusters_file == '-' else open(clusters_file, 'r')
+    try:
+        for line in istream:
+            line_items = line.split()
+            if in_shard and not in_shard(line_items[0]):
+                continue
+            yield line_items[0], gene_key(line_items[1])
+    finally:
+        if istream is not sys.stdin:
+            istream.close()
+
+def parse_fasta(istream):
+    """ Yield the (header, sequence) entries of a multi-FASTA stream.
+    """
+
+    header, seq = None, []
+    for line in istream:
+        line = line.rstrip()
+        if line.startswith(">"):
+            if header: yield (header, ''.join(seq))
+            header, seq = line, []
+        else:
+            seq.append(line)
+    if header: yield (header, ''.join(seq))
+
+def read_genes_catalog(genes_catalog):
+    """ Yield the (gene number, (header, sequence)) pairs of a multi-FASTA genes catalog. Genes are numbered from 1.
+    """
+
+    with open(genes_catalog, 'r') as istream:
+        for gene_num, fasta_entry in enumerate(parse_fasta(istream), start=1):
+            yield gene_num, fasta_entry
+
+def read_profiles(profiles_file, with_header=False):
+    """ Yield the (gene name, line) pairs of a profiles table.
+    """
+
+    with open(profiles_file, 'r') as istream:
+        if with_header:
+            next(istream)
+
+        for line in istream:
+            yield line.split(None, 1)[0], line
+
+def read_annotations(annotation_file):
+    """ Yield the (gene number, line) pairs of an annotation file with one line per gene of the catalog. Genes are numbered from 1.
+    """
+
+    with open(annotation_file, 'r') as istream:
+        for gene_num, annot in enumerate(istream, start=1):
+            yield gene_num, annot
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+"""Deterministic assignment of clusters to shards and shard manifests.
+
+The run_* functions of the other modules take a shard (i, N) and an optional clusters size file to
+balance shards. They then only process the clusters of shard i, write shard-local outputs and
+describe them in a manifest, which records the script given by the caller. mgs.merge combines the
+outputs of all the shards of a run.
+"""
+
+from __future__ import print_function
+import argparse
+import heapq
+import json
+import os
+import zlib
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+def shard(value):
+    """Parse a shard specification i/N where i is between 1 and N.
+    """
+
+    try:
+        index, num_shards = [int(item) for item in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("{0} is not a shard specification i/N.".format(value))
+
+    if not 1 <= index <= num_shards:
+        raise argparse.ArgumentTypeError("shard index must be between 1 and {0}.".format(num_shards))
+
+    return index, num_shards
+
+def add_shard_arguments(parser):
+    """ Add the --shard and --shard-sizes options to a parser.
+    """
+
+    parser.add_argument('--shard', dest='shard', type=shard, default=None,
+        help='Only process the clusters of shard i out of N (e.g. 3/10). Outputs are shard-local and described by a manifest.')
+
+    parser.add_argument('--shard-sizes', dest='shard_sizes', default=None,
+        help='Clusters size file (see extract_clusters_size.py) used to balance shards by total size instead of by hash.')
+
+def stable_hash(cluster_name):
+    """ Hash a cluster name the same way on every run and every node.
+    """
+
+    return zlib.crc32(cluster_name) & 0xffffffff
+
+def read_clusters_size(clusters_size_file):
+    """ Read a clusters size file which contains line by line, tab separated pairs of values <cluster name> <size>.
+    """
+
+    clusters_size = dict()
+
+    with open(clusters_size_file, 'r') as istream:
+        for line in istream:
+            cluster_name, cluster_size = line.split()
+            clusters_size[cluster_name] = int(cluster_size)
+
+    return clusters_size
+
+def balance_clusters(clusters_size, num_shards):
+    """ Assign clusters to shards so that shards have about the same total size.
+
+    Clusters are assigned from the largest to the smallest to the least loaded shard.
+    Ties are broken by name and shard index so the assignment is deterministic.
+    """
+
+    cluster_to_shard = dict()
+    shards_load = [(0, shard_index) for shard_index in xrange(num_shards)]
+
+    for cluster_name, cluster_size in sorted(clusters_size.iteritems(), key=lambda (name, size): (-size, name)):
+        shard_load, shard_index = heapq.heappop(shards_load)
+        cluster_to_shard[cluster_name] = shard_index
+        heapq.heappush(shards_load, (shard_load + cluster_size, shard_index))
+
+    return cluster_to_shard
+
+def get_shard_filter(shard, clusters_size_file=None):
+    """ Return a function which tells whether a cluster belongs to the shard, or None without sharding.
+
+    Clusters missing from the clusters size file are assigned by hash.
+    """
+
+    if shard is None:
+        return None
+
+    index, num_shards = shard
+    cluster_to_shard = balance_clusters(read_clusters_size(clusters_size_file), num_shards) if clusters_size_file else dict()
+
+    def in_shard(cluster_name):
+        if cluster_name in cluster_to_shard:
+            return cluster_to_shard[cluster_name] == index-1
+        return stable_hash(cluster_name) % num_shards == index-1
+
+    return in_shard
+
+def shard_path(path, shard):
+    """ Return the shard-local version of an output path.
+    """
+
+    if shard is None:
+        return path
+
+    index, num_shards = shard
+    return '{0}.shard-{1}-of-{2}'.format(path, index, num_shards)
+
+def write_manifest(manifest_file, script, shard, outputs):
+    """ Write the manifest of a shard.
+
+    script is the path of the command line tool which wrote the outputs, or None when
+    called from the library. Each output is a dict with the kind of output, the shard-local
+    path and the target path of the merged output. Outputs of kind cluster_files also list
+    the files written in the target directory.
+    """
+
+    index, num_shards = shard
+    manifest = {'script': os.path.basename(script) if script else None, 'shard': index, 'num_shards': num_shards, 'outputs': outputs}
+
+    with open(manifest_file, 'w') as ostream:
+        json.dump(manifest, ostream, indent=2, sort_keys=True)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""Sizes of clusters and report of their distribution."""
+
+from __future__ import print_function
+import operator
+import sys
+from array import array
+from collections import defaultdict
+from mgs.parallel import fork_map
+from mgs.sharding import get_shard_filter, shard_path, write_manifest
+
+__author__ = "Florian Plaza Oñate"
+__copyright__ = "Copyright 2014, Enterome"
+__version__ = "1.0.0"
+__maintainer__ = "Florian Plaza Oñate"
+__email__ = "fplaza-onate@enterome.com"
+__status__ = "Development"
+
+QUANTILES = (25, 50, 75, 90, 99)
+
+def get_clusters_size(clusters_file, in_shard=None):
+    """ Read the clusters file and creates a dict which map each cluster to its size.
+
+    With in_shard, only the clusters of the shard are kept. Memory depends on the number of clusters.
+    """
+
+    clusters_size = defaultdict(int)
+
+    with open(clusters_file, 'r') as istream:
+        for line in istream:
+            cluster_name = line.split(None, 1)[0]
+            clusters_size[cluster_name] += 1
+
+    if in_shard:
+        clusters_size = dict((cluster_name, cluster_size) for cluster_name, cluster_size in clusters_size.iteritems()
+                if in_shard(cluster_name))
+
+    return clusters_size
+
+def code_clusters_file(clusters_file, in_shard=None):
+    """ Read the clusters file and code cluster names and gene names as integers.
+
+    Returns the map of the names of the clusters of the shard to their codes, the array of the
+    cluster code of each line of these clusters, the number of gene codes and the array of the
+    gene code of each of these lines.
+    """
+
+    import numpy as np
+
+    cluster_codes, gene_codes = dict(), dict()
+    clusters_ids, genes_ids = array('l'), array('l')
+
+    with open(clusters_file, 'r') as istream:
+        for line in istream:
+            line_items = line.split(None, 2)
+            cluster_name = line_items[0]
+
+            cluster_id = cluster_codes.get(cluster_name)
+            if cluster_id is None:
+                # Clusters of other shards are coded -1 and skipped
+                cluster_id = len(cluster_codes) if not in_shard or in_shard(cluster_name) else -1
+                cluster_codes[cluster_name] = cluster_id
+            if cluster_id < 0:
+                continue
+            clusters_ids.append(cluster_id)
+
+            gene_id = gene_codes.get(line_items[1])
+            if gene_id is None:
+                gene_id = gene_codes[line_items[1]] = len(gene_codes)
+            genes_ids.append(gene_id)
+
+    cluster_codes = dict((cluster_name, cluster_id) for cluster_name, cluster_id in cluster_codes.iteritems() if cluster_id >= 0)
+    clusters_ids = np.frombuffer(clusters_ids, dtype=np.dtype('l')) if clusters_ids else np.zeros(0, dtype=np.int64)
+    genes_ids = np.frombuffer(genes_ids, dtype=np.dtype('l')) if genes_ids else np.zeros(0, dtype=np.int64)
+
+    return cluster_codes, clusters_ids, len(gene_codes), genes_ids
+
+def get_clusters_size_and_genes(clusters_file, min_cluster_size=1, max_cluster_size=sys.maxint, in_shard=None):
+    """ Same as get_clusters_size but also returns the number of distinct genes of the clusters within
+    size bounds and how many of them belong to several clusters.
+
+    Cluster and gene names are coded as integers so that sizes and the number of clusters of each
+    gene are counted with numpy.bincount. Memory depends on the number of lines.
+    """
+
+    import numpy as np
+
+    cluster_codes, clusters_ids, num_gene_codes, genes_ids = code_clusters_file(clusters_file, in_shard)
+
+    sizes = np.bincount(clusters_ids, minlength=len(cluster_codes))
+    clusters_size = dict((cluster_name, int(sizes[cluster_id])) for cluster_name, cluster_id in cluster_codes.iteritems())
+
+    in_bounds = (sizes >= min_cluster_size) & (sizes <= max_cluster_size)
+    genes_num_clusters = np.bincount(genes_ids[in_bounds[clusters_ids]], minlength=num_gene_codes)
+    num_genes = int(np.count_nonzero(genes_num_clusters))
+    num_multi_cluster_genes = int(np.count_nonzero(genes_num_clusters > 1))
+
+    return clusters_size, num_genes, num_multi_cluster_genes
+
+def write_clusters_size(clusters_size, min_cluster_size, max_cluster_size, output_file):
+    # Clusters of the same size are sorted by name so that merged shards match a single run
+    clusters_size = sorted(sorted(clusters_size.iteritems()), key=operator.itemgetter(1), reverse=True)
+
+    # The output file - is the standard output
+    ostream = sys.stdout if output_file == '-' else open(output_file, 'w')
+    try:
+        for cluster_name, cluster_size in clusters_size:
+            if (cluster_size >= min_cluster_size) and (cluster_size <= max_cluster_size):
+                print('{0}\t{1}'.format(cluster_name, cluster_size), file=ostream)
+    finally:
+        if ostream is not sys.stdout:
+            ostream.close()
+
+def size_bin_name(bin_index):
+    """ Name of a log2 bin of clusters size: 1, 2-3, 4-7, 8-15...
+    """
+
+    low, high = 2**bin_index, 2**(bin_index+1) - 1
+    return str(low) if low == high else '{0}-{1}'.format(low, high)
+
+# Shard filter of clusters, set by fork_map
+in_shard = None
+
+def process_clusters_file(task):
+    """ Count the clusters size of a clusters file, write them and, for the report, summarize their distribution.
+    """
+
+    clusters_file, output_file, min_cluster_size, max_cluster_size, with_report = task
+
+    if not with_report:
+        write_clusters_size(get_clusters_size(clusters_file, in_shard), min_cluster_size, max_cluster_size, output_file)
+        return None
+
+    import numpy as np
+
+    clusters_size, num_genes, num_multi_cluster_genes = get_clusters_size_and_genes(clusters_file, min_cluster_size, max_cluster_size, in_shard)
+    write_clusters_size(clusters_size, min_cluster_size, max_cluster_size, output_file)
+
+    sizes = np.array([cluster_size for cluster_size in clusters_size.itervalues()
+        if min_cluster_size <= cluster_size <= max_cluster_size], dtype=np.int64)
+
+    histogram = np.bincount(np.log2(sizes).astype(np.int64)) if len(sizes) else np.zeros(0, dtype=np.int64)
+    quantiles = np.percentile(sizes, QUANTILES) if len(sizes) else [float('nan')] * len(QUANTILES)
+
+    return {'clusters_file': clusters_file, 'clusters': len(sizes), 'assignments': int(sizes.sum()),
+        'genes': num_genes, 'multi_cluster_genes': num_multi_cluster_genes,
+        'min': int(sizes.min()) if len(sizes) else 0, 'max': int(sizes.max()) if len(sizes) else 0,
+        'quantiles': list(quantiles), 'histogram': [int(count) for count in histogram]}
+
+def write_report(clusters_files_summary, catalog_size, report_file):
+    """ Write one row per clusters file with its number of clusters and genes, the size quantiles
+    and the number of clusters in each log2 size bin.
+    """
+
+    num_bins = max(len(summary['histogram']) for summary in clusters_files_summary)
+
+    with open(report_file, 'w') as ostream:
+        header = ['clusters_file', 'clusters', 'assignments', 'genes', 'multi_cluster_genes', 'catalog_coverage', 'min_size']
+        header.extend('q{0}_size'.format(quantile) for quantile in QUANTILES)
+        header.append('max_size')
+        header.extend('size_' + size_bin_name(bin_index) for bin_index in xrange(num_bins))
+        print('\t'.join(header), file=ostream)
+
+        for summary in clusters_files_summary:
+            row = [summary['clusters_file'], summary['clusters'], summary['assignments'], summary['genes'], summary['multi_cluster_genes'],
+                '{0:.4f}'.format(float(summary['genes']) / catalog_size) if catalog_size else 'NA', summary['min']]
+            row.extend('{0:.1f}'.format(quantile) for quantile in summary['quantiles'])
+            row.append(summary['max'])
+            row.extend(summary['histogram'] + [0] * (num_bins - len(summary['histogram'])))
+            print('\t'.join(str(value) for value in row), file=ostream)
+
+def run_clusters_size(clusters_files, output_files, min_cluster_size=1, max_cluster_size=sys.maxint, report_file=None, catalog_size=None,
+        threads=1, manifest_prefix=None, shard=None, shard_sizes=None, script=None):
+    """ Write the clusters size of each clusters file to the matching output file, processing up to threads files in parallel.
+
+    With report_file, the size distribution of the clusters of each file is also written, which requires NumPy.
+    With shard, the path of the manifest starts with manifest_prefix. Progress is printed to the standard
+    error when an output file is -, so that it is not mixed with clusters size.
+    """
+
+    progress_stream = sys.stderr if '-' in output_files else sys.stdout
+    num_steps = 2 if report_file else 1
+    print('STEP 1/{0}: Computing clusters size of {1} clusters files...'.format(num_steps, len(clusters_files)), file=progress_stream)
+    tasks = [(clusters_file, shard_path(output_file, shard), min_cluster_size, max_cluster_size, bool(report_file))
+        for clusters_file, output_file in zip(clusters_files, output_files)]
+
+    clusters_files_summary = list(fork_map(process_clusters_file, tasks, threads, in_shard=get_shard_filter(shard, shard_sizes)))
+
+    if report_file:
+        print('STEP 2/2: Writing clusters size report...', file=progress_stream)
+        write_report(clusters_files_summary, catalog_size, report_file)
+    if shard:
+        write_manifest(shard_path(manifest_prefix or output_files[0], shard) + '.manifest.json', script, shard,
+            [{'kind': 'clusters_size', 'path': task[1], 'target': output_file} for task, output_file in zip(tasks, output_files)])